@@ -0,0 +1,109 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from time import monotonic
+from typing import Any, Callable, Hashable, Optional
+
+_MISSING = object()
+
+
+class CacheBackend(ABC):
+    """Key/value store behind the shared caches.
+
+    The in-process ``TTLCache`` is the default; a networked store (Redis or
+    a local stand-in) implements the same calls to share entries
+    between workers.
+
+    Every entry a backend drops on its own (capacity, expiry) must be
+    reported through ``on_evict(key, value)``, which owners set to clean
+    up indexes kept next to the cache. ``pop`` and ``clear`` are the
+    owner's own removals and are not reported.
+    """
+
+    on_evict: Optional[Callable[[Hashable, Any], None]] = None
+
+    @abstractmethod
+    def get(self, key: Hashable, default: Any = None) -> Any: ...
+
+    @abstractmethod
+    def set(self, key: Hashable, value: Any) -> None: ...
+
+    @abstractmethod
+    def pop(self, key: Hashable) -> Any: ...
+
+    @abstractmethod
+    def clear(self) -> None: ...
+
+    @abstractmethod
+    def stats(self) -> dict: ...
+
+
+class TTLCache(CacheBackend):
+    """Bounded LRU mapping whose entries also expire after ``ttl`` seconds.
+
+    Lives in one worker process and is only touched from the event loop,
+    so no locking is needed.
+    """
+
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: Optional[float] = None,
+        on_evict: Optional[Callable[[Hashable, Any], None]] = None,
+    ):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.on_evict = on_evict
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Hashable, tuple]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            self.misses += 1
+            return default
+        expires, value = item
+        if expires is not None and expires < monotonic():
+            del self._data[key]
+            if self.on_evict:
+                self.on_evict(key, value)
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key: Hashable, value: Any) -> None:
+        if self.maxsize <= 0:
+            return
+        expires = monotonic() + self.ttl if self.ttl is not None else None
+        self._data[key] = (expires, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            evicted, (_, old) = self._data.popitem(last=False)
+            if self.on_evict:
+                self.on_evict(evicted, old)
+
+    def pop(self, key: Hashable) -> Any:
+        item = self._data.pop(key, None)
+        return item[1] if item else None
+
+    def discard_where(self, predicate: Callable[[Any], bool]) -> None:
+        for key in [k for k, (_, v) in self._data.items() if predicate(v)]:
+            del self._data[key]
+
+    def clear(self) -> None:
+        self._data.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
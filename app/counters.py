@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import random
+from collections import defaultdict
+
+from sqlalchemy import bindparam, case, delete, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import db.engine
+from app.ranking import rescored
+from db.engine import settings, upsert
+from db.models import LikeCounterShard, Tweet, User
+
+logger = logging.getLogger(__name__)
+
+
+def _plus(column, delta: int):
+    """``column + delta`` evaluated by the database, never below zero."""
+    if delta >= 0:
+        return column + delta
+    return case((column + delta > 0, column + delta), else_=0)
+
+
+async def add_likes(session: AsyncSession, tweet_id: int, delta: int):
+    """Single-statement ``likes_count`` update.
+
+    Returns the new ``(likes_count, author_id)`` row, or None. The
+    ranked-feed score and the fragment-cache version are refreshed in the
+    same statement. With
+    LIKES_WRITE_BEHIND the change is parked in a counter shard instead
+    and applied later by ``flush_likes``.
+    """
+    if settings.LIKES_WRITE_BEHIND:
+        return await _add_pending_likes(session, tweet_id, delta)
+    likes = _plus(Tweet.likes_count, delta)
+    result = await session.execute(
+        update(Tweet)
+        .where(Tweet.id == tweet_id)
+        .values(
+            likes_count=likes,
+            score=rescored(Tweet.score, Tweet.likes_count, likes),
+            version=Tweet.version + 1,
+        )
+        .returning(Tweet.likes_count, Tweet.author_id)
+    )
+    return result.first()
+
+
+def pending_likes():
+    """Correlated sum of a tweet's unflushed like deltas."""
+    return (
+        select(func.coalesce(func.sum(LikeCounterShard.delta), 0))
+        .where(LikeCounterShard.tweet_id == Tweet.id)
+        .scalar_subquery()
+    )
+
+
+def pending_changes():
+    """Correlated count of a tweet's unflushed likes and unlikes."""
+    return (
+        select(func.coalesce(func.sum(LikeCounterShard.changes), 0))
+        .where(LikeCounterShard.tweet_id == Tweet.id)
+        .scalar_subquery()
+    )
+
+
+async def _add_pending_likes(session: AsyncSession, tweet_id: int, delta: int):
+    # a random shard: concurrent likers of one tweet rarely share a row lock
+    stmt = upsert(session, LikeCounterShard).values(
+        tweet_id=tweet_id,
+        shard=random.randrange(settings.LIKES_COUNTER_SHARDS),
+        delta=delta,
+        changes=1,
+    )
+    await session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["tweet_id", "shard"],
+            set_={
+                "delta": LikeCounterShard.delta + stmt.excluded.delta,
+                "changes": LikeCounterShard.changes + 1,
+            },
+        )
+    )
+    # read-your-writes: the stored count plus everything still pending
+    result = await session.execute(
+        select(
+            (Tweet.likes_count + pending_likes()).label("likes_count"),
+            Tweet.author_id,
+        ).where(Tweet.id == tweet_id)
+    )
+    return result.first()
+
+
+async def flush_likes(session: AsyncSession) -> int:
+    """Fold every pending counter shard into its tweet; returns tweets touched.
+
+    Shards are consumed with DELETE ... RETURNING, so flushers running in
+    several workers never apply the same delta twice.
+    """
+    result = await session.execute(
+        delete(LikeCounterShard).returning(
+            LikeCounterShard.tweet_id, LikeCounterShard.delta
+        )
+    )
+    totals = defaultdict(int)
+    for tweet_id, delta in result:
+        totals[tweet_id] += delta
+    if not totals:
+        return 0
+
+    # Core table, so the list of parameters runs as one executemany
+    tweets = Tweet.__table__
+    new_likes = tweets.c.likes_count + bindparam("delta")
+    likes = case((new_likes > 0, new_likes), else_=0)
+    await session.execute(
+        update(tweets)
+        .where(tweets.c.id == bindparam("tweet_id"))
+        .values(
+            likes_count=likes,
+            score=rescored(tweets.c.score, tweets.c.likes_count, likes),
+            version=tweets.c.version + 1,
+        ),
+        # id order: concurrent flushers lock tweet rows in the same sequence
+        [{"tweet_id": t, "delta": d} for t, d in sorted(totals.items())],
+    )
+    return len(totals)
+
+
+class LikeFlusher:
+    """Background task applying pending like deltas every LIKES_FLUSH_INTERVAL."""
+
+    def __init__(self):
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.LIKES_FLUSH_INTERVAL)
+            try:
+                await self.flush()
+            except Exception:
+                logger.warning("like counter flush failed", exc_info=True)
+
+    async def flush(self) -> int:
+        async with db.engine.AsyncSessionLocal() as session:
+            flushed = await flush_likes(session)
+            await session.commit()
+        return flushed
+
+    def start(self) -> None:
+        if settings.LIKES_WRITE_BEHIND and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        # nothing left pending behind a restart
+        try:
+            await self.flush()
+        except Exception:
+            logger.warning("final like counter flush failed", exc_info=True)
+
+
+like_flusher = LikeFlusher()
+
+
+async def add_follow(
+    session: AsyncSession, follower_id: int, following_id: int, delta: int
+) -> None:
+    """Move both follow counters in one UPDATE touching the two user rows."""
+    await session.execute(
+        update(User)
+        .where(User.id.in_([follower_id, following_id]))
+        .values(
+            followers_count=case(
+                (User.id == following_id, _plus(User.followers_count, delta)),
+                else_=User.followers_count,
+            ),
+            following_count=case(
+                (User.id == follower_id, _plus(User.following_count, delta)),
+                else_=User.following_count,
+            ),
+        )
+        .execution_options(synchronize_session=False)
+    )
@@ -0,0 +1,324 @@
+import asyncio
+import json
+import logging
+import uuid
+from collections import defaultdict
+from typing import Callable, Iterable, List, Optional
+
+from db.engine import after_commit, settings
+
+logger = logging.getLogger(__name__)
+
+# returned to a subscriber that fell behind: refetch the feed, then resume
+RESYNC = {"type": "resync"}
+
+# Postgres refuses NOTIFY payloads of 8000 bytes or more
+NOTIFY_MAX_BYTES = 7900
+
+
+class Subscription:
+    """One live connection: a bounded queue of events for the authors it follows.
+
+    When the client reads slower than events arrive the queue is dropped
+    and replaced by a single ``resync`` event, so a slow connection holds
+    at most ``maxsize`` events and never blocks publishers.
+
+    ``authors`` keeps follow order, oldest first: past ``max_authors`` the
+    oldest follow stops being routed. The user's own id is always kept.
+    """
+
+    def __init__(
+        self,
+        user_id: int,
+        authors: Iterable[int],
+        maxsize: int,
+        max_authors: Optional[int] = None,
+    ):
+        self.user_id = user_id
+        self.max_authors = max_authors
+        self.authors: dict = {}
+        for author_id in authors:
+            self.follow(author_id)
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize)
+        self.lagging = False
+
+    def follow(self, author_id: int) -> List[int]:
+        """Route ``author_id`` here; returns the authors evicted for it."""
+        self.authors.pop(author_id, None)
+        self.authors[author_id] = None
+        others = len(self.authors) - (self.user_id in self.authors)
+        if self.max_authors is None or others <= self.max_authors:
+            return []
+        oldest = next(a for a in self.authors if a != self.user_id)
+        del self.authors[oldest]
+        return [oldest]
+
+    def offer(self, event: dict) -> None:
+        if self.lagging:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.resync()
+
+    def resync(self) -> None:
+        while not self.queue.empty():
+            self.queue.get_nowait()
+        self.queue.put_nowait(RESYNC)
+        self.lagging = True
+
+    async def next(self, timeout: float) -> Optional[dict]:
+        """Next event, or None after ``timeout`` seconds of silence."""
+        try:
+            event = await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        if event is RESYNC:
+            self.lagging = False
+        return event
+
+
+class EventBus:
+    """In-process pub/sub routing feed events to followers' connections.
+
+    Events are dicts with a ``type``:
+
+    - ``tweet`` / ``likes`` carry ``author_id`` and go to every connection
+      following that author (and to the author's own);
+    - ``follow`` carries ``follower_id``, ``following_id`` and ``active``
+      and only updates routing for the follower's open connections;
+    - ``reset`` means events may have been lost; every connection is told
+      to resync.
+
+    Handlers registered with ``on`` see every event of their type, routed
+    or not.
+
+    ``relay`` forwards published events to the other workers (see
+    ``PgNotifyBridge``); events arriving from them enter via ``dispatch``.
+    """
+
+    def __init__(
+        self,
+        queue_size: int,
+        max_connections: int,
+        max_per_user: int,
+        max_authors: Optional[int] = None,
+    ):
+        self.queue_size = queue_size
+        self.max_connections = max_connections
+        self.max_per_user = max_per_user
+        self.max_authors = max_authors
+        self.relay: Optional[Callable[[dict], None]] = None
+        self.resyncs = 0
+        self._by_author: dict = defaultdict(set)
+        self._by_user: dict = defaultdict(set)
+        self._handlers: dict = defaultdict(list)
+        self.on("follow", self._follow)
+        self.on("reset", self._reset)
+
+    def on(self, event_type: str, handler: Callable[[dict], None]) -> None:
+        """Run ``handler(event)`` in every worker an ``event_type`` reaches.
+
+        Process-local caches register their invalidation here and publish
+        the event instead of touching the cache directly.
+        """
+        self._handlers[event_type].append(handler)
+
+    def __len__(self) -> int:
+        return sum(len(subs) for subs in self._by_user.values())
+
+    def subscribe(self, user_id: int, authors: Iterable[int]) -> Optional[Subscription]:
+        """New subscription, or None when a connection limit is reached.
+
+        ``authors`` go oldest follow first, so the newest are kept when
+        there are more than ``max_authors``.
+        """
+        if len(self) >= self.max_connections:
+            return None
+        if len(self._by_user[user_id]) >= self.max_per_user:
+            return None
+        subscription = Subscription(
+            user_id, [user_id, *authors], self.queue_size, self.max_authors
+        )
+        self._by_user[user_id].add(subscription)
+        for author_id in subscription.authors:
+            self._by_author[author_id].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription) -> None:
+        self._by_user[subscription.user_id].discard(subscription)
+        if not self._by_user[subscription.user_id]:
+            del self._by_user[subscription.user_id]
+        for author_id in subscription.authors:
+            self._unroute(author_id, subscription)
+
+    def _unroute(self, author_id: int, subscription: Subscription) -> None:
+        subscribers = self._by_author.get(author_id)
+        if subscribers is not None:
+            subscribers.discard(subscription)
+            if not subscribers:
+                del self._by_author[author_id]
+
+    def publish(self, event: dict) -> None:
+        """Dispatch here, then in every other worker when a relay is set."""
+        self.dispatch(event)
+        if self.relay is not None:
+            self.relay(event)
+
+    def dispatch(self, event: dict) -> None:
+        for handler in self._handlers.get(event["type"], ()):
+            # one broken cache must not keep the event from the others
+            try:
+                handler(event)
+            except Exception:
+                logger.exception("%s handler failed", event["type"])
+        for subscription in tuple(self._by_author.get(event.get("author_id"), ())):
+            if not subscription.lagging:
+                subscription.offer(event)
+                self.resyncs += subscription.lagging
+
+    def _follow(self, event: dict) -> None:
+        author_id = event["following_id"]
+        for subscription in self._by_user.get(event["follower_id"], ()):
+            if event["active"]:
+                for evicted in subscription.follow(author_id):
+                    self._unroute(evicted, subscription)
+                self._by_author[author_id].add(subscription)
+            elif author_id != subscription.user_id:
+                subscription.authors.pop(author_id, None)
+                self._unroute(author_id, subscription)
+
+    def _reset(self, event: dict) -> None:
+        for subscriptions in self._by_user.values():
+            for subscription in subscriptions:
+                subscription.resync()
+        self.resyncs += 1
+
+    def stats(self) -> dict:
+        return {
+            "connections": len(self),
+            "users": len(self._by_user),
+            "authors": len(self._by_author),
+            "resyncs": self.resyncs,
+            "relay": self.relay is not None,
+        }
+
+
+bus = EventBus(
+    settings.LIVE_QUEUE_SIZE,
+    settings.LIVE_MAX_CONNECTIONS,
+    settings.LIVE_MAX_CONNECTIONS_PER_USER,
+    settings.LIVE_MAX_AUTHORS,
+)
+
+
+def publish_after_commit(session, event: dict) -> None:
+    """Publish ``event`` once the request's transaction is committed."""
+    after_commit(session, lambda: bus.publish(event))
+
+
+class PgNotifyBridge:
+    """Relays bus events between workers over Postgres LISTEN/NOTIFY.
+
+    Holds one dedicated asyncpg connection (LISTEN does not work through
+    PgBouncer in transaction mode, hence ``LIVE_NOTIFY_URL``). Outgoing
+    events are queued and sent by a single task; each carries this
+    worker's ``origin`` so its own notifications are not delivered twice.
+    An event too big for one NOTIFY is split along its list field (the
+    ``user_ids`` of a busy author's ``feed_users``), or replaced by a
+    ``reset`` when it has none.
+
+    Events sent while the connection is down are lost, so after a
+    reconnect ``reset`` is dispatched locally and notified to the other
+    workers: caches registered for it start over and live clients are
+    told to resync. A NOTIFY failing on a live connection drops only that
+    event and broadcasts ``reset`` the same way, and a full backlog is
+    replaced by a single ``reset``.
+    """
+
+    def __init__(self, bus: EventBus, dsn: str, channel: str):
+        self.bus = bus
+        self.dsn = dsn
+        self.channel = channel
+        self.origin = uuid.uuid4().hex
+        self._reset_payload = json.dumps({"type": "reset", "origin": self.origin})
+        self._outgoing: asyncio.Queue = asyncio.Queue(settings.LIVE_NOTIFY_BACKLOG)
+        self._task: Optional[asyncio.Task] = None
+
+    def _encode(self, event: dict) -> List[str]:
+        payload = json.dumps({**event, "origin": self.origin})
+        if len(payload.encode()) < NOTIFY_MAX_BYTES:
+            return [payload]
+        for key, value in event.items():
+            if isinstance(value, list) and len(value) > 1:
+                half = len(value) // 2
+                return self._encode({**event, key: value[:half]}) + self._encode(
+                    {**event, key: value[half:]}
+                )
+        logger.warning("%s event too big to notify, sending reset", event["type"])
+        return [self._reset_payload]
+
+    def send(self, event: dict) -> None:
+        for payload in self._encode(event):
+            try:
+                self._outgoing.put_nowait(payload)
+            except asyncio.QueueFull:
+                # the others would miss events: they start over instead
+                logger.warning("live notify backlog full, sending reset instead")
+                while not self._outgoing.empty():
+                    self._outgoing.get_nowait()
+                self._outgoing.put_nowait(self._reset_payload)
+                return
+
+    async def _notify(self, connection, payload: str) -> None:
+        await connection.execute("SELECT pg_notify($1, $2)", self.channel, payload)
+
+    def _received(self, connection, pid, channel, payload: str) -> None:
+        event = json.loads(payload)
+        if event.pop("origin", None) != self.origin:
+            self.bus.dispatch(event)
+
+    async def _run(self) -> None:
+        import asyncpg
+
+        connected_before = False
+        while True:
+            connection = None
+            try:
+                connection = await asyncpg.connect(self.dsn)
+                await connection.add_listener(self.channel, self._received)
+                if connected_before:
+                    self.bus.dispatch({"type": "reset"})
+                    await self._notify(connection, self._reset_payload)
+                connected_before = True
+                while True:
+                    payload = await self._outgoing.get()
+                    try:
+                        await self._notify(connection, payload)
+                    except Exception:
+                        if connection.is_closed():
+                            raise
+                        logger.warning("live notify failed", exc_info=True)
+                        await self._notify(connection, self._reset_payload)
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.warning("live notify connection lost, retrying", exc_info=True)
+                await asyncio.sleep(1)
+            finally:
+                if connection is not None and not connection.is_closed():
+                    await connection.close()
+
+    def start(self) -> None:
+        self.bus.relay = self.send
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        self.bus.relay = None
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
@@ -0,0 +1,202 @@
+from collections import defaultdict
+from typing import List, Optional, Sequence
+
+from sqlalchemy import desc, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import TTLCache
+from app.counters import pending_changes, pending_likes
+from app.pagination import decode_cursor, encode_cursor, split_page
+from app.responses import dumps
+from db.engine import settings
+from db.models import Like, Media, Tweet, User
+
+# feed mode -> keyset sort columns, all descending, unique thanks to id.
+# Only "latest" sorts on an immutable key. likes_count and score change
+# between page requests, so a tweet liked or unliked in the meantime can
+# move across the cursor and be repeated or skipped in popular/ranked.
+FEED_ORDERS = {
+    "popular": (Tweet.likes_count, Tweet.created_at, Tweet.id),
+    "latest": (Tweet.id,),
+    "ranked": (Tweet.score, Tweet.id),
+}
+
+
+def tweet_rows():
+    """Column-only SELECT of everything a rendered tweet needs from its row.
+
+    Callers add WHERE/ORDER BY/LIMIT and pass the fetched rows to
+    ``render_tweets``; no ORM objects are built on the feed path.
+    """
+    likes_count = Tweet.likes_count
+    if settings.LIKES_WRITE_BEHIND:
+        likes_count = (Tweet.likes_count + pending_likes()).label("likes_count")
+    return select(
+        Tweet.id,
+        Tweet.content,
+        likes_count,
+        Tweet.score,
+        Tweet.version,
+        *_pending_columns(),
+        Tweet.created_at,
+        Tweet.author_id,
+        User.username.label("author_name"),
+    ).join(User, User.id == Tweet.author_id)
+
+
+def _pending_columns():
+    # unflushed likes change the render without bumping Tweet.version
+    if settings.LIKES_WRITE_BEHIND:
+        return [pending_changes().label("changes")]
+    return []
+
+
+def _likers_stmt(tweet_ids: List[int]):
+    cap = settings.FEED_LIKERS_LIMIT
+    if cap is None:
+        return (
+            select(Like.tweet_id, User.id, User.username)
+            .join(User, User.id == Like.user_id)
+            .where(Like.tweet_id.in_(tweet_ids))
+            .order_by(Like.id)
+        )
+    # most recent likers first, at most ``cap`` per tweet
+    ranked = (
+        select(
+            Like.tweet_id,
+            Like.user_id,
+            Like.id.label("like_id"),
+            func.row_number()
+            .over(partition_by=Like.tweet_id, order_by=desc(Like.id))
+            .label("rank"),
+        )
+        .where(Like.tweet_id.in_(tweet_ids))
+        .subquery()
+    )
+    return (
+        select(ranked.c.tweet_id, User.id, User.username)
+        .join(User, User.id == ranked.c.user_id)
+        .where(ranked.c.rank <= cap)
+        .order_by(desc(ranked.c.like_id))
+    )
+
+
+async def render_tweets(
+    session: AsyncSession, rows: Sequence, variant: Optional[int] = None
+) -> List[dict]:
+    """Turn ``tweet_rows()`` results into API dicts with two batched queries.
+
+    ``variant`` points attachment urls at a resized copy of each image.
+    """
+    tweet_ids = [row.id for row in rows]
+    if not tweet_ids:
+        return []
+
+    attachments = defaultdict(list)
+    result = await session.execute(
+        select(Media.tweet_id, Media.url)
+        .where(Media.tweet_id.in_(tweet_ids))
+        .order_by(Media.id)
+    )
+    for tweet_id, url in result:
+        attachments[tweet_id].append(f"{url}?w={variant}" if variant else url)
+
+    likes = defaultdict(list)
+    result = await session.execute(_likers_stmt(tweet_ids))
+    for tweet_id, user_id, username in result:
+        likes[tweet_id].append({"user_id": user_id, "name": username})
+
+    return [
+        {
+            "id": row.id,
+            "content": row.content,
+            "attachments": attachments[row.id],
+            "author": {"id": row.author_id, "name": row.author_name},
+            "likes": likes[row.id],
+            "likes_count": row.likes_count,
+        }
+        for row in rows
+    ]
+
+
+# pre-encoded tweets keyed by (id, version, pending changes, variant); any
+# change to what a tweet renders moves one of them, so entries never need
+# invalidating
+fragment_cache = TTLCache(settings.FEED_FRAGMENT_CACHE_SIZE)
+
+
+def page_rows(order):
+    """Just enough of each tweet to order a page and look up its fragment."""
+    columns = [Tweet.id, Tweet.version, *_pending_columns()]
+    columns += [column for column in order if column.key not in ("id", "version")]
+    return select(*columns)
+
+
+def _fragment_key(row, variant: Optional[int]):
+    return row.id, row.version, getattr(row, "changes", 0), variant
+
+
+async def tweet_fragments(
+    session: AsyncSession, page: Sequence, variant: Optional[int] = None
+) -> List[bytes]:
+    """Encoded tweets for ``page_rows()`` results, in page order.
+
+    Cached fragments are reused as is; the misses are rendered together
+    with one batched ``render_tweets`` call.
+    """
+    fragments = {}
+    missing = []
+    for row in page:
+        fragment = fragment_cache.get(_fragment_key(row, variant))
+        if fragment is None:
+            missing.append(row.id)
+        else:
+            fragments[row.id] = fragment
+
+    if missing:
+        result = await session.execute(tweet_rows().where(Tweet.id.in_(missing)))
+        rows = result.all()
+        for row, tweet in zip(rows, await render_tweets(session, rows, variant)):
+            fragment = dumps(tweet)
+            fragment_cache.set(_fragment_key(row, variant), fragment)
+            fragments[row.id] = fragment
+
+    # a tweet deleted between the two queries simply drops out of the page
+    return [fragments[row.id] for row in page if row.id in fragments]
+
+
+def feed_body(fragments: List[bytes], next_cursor: Optional[str]) -> bytes:
+    return b"".join(
+        [
+            b'{"result":true,"tweets":[',
+            b",".join(fragments),
+            b'],"next_cursor":',
+            dumps(next_cursor),
+            b"}",
+        ]
+    )
+
+
+async def linked_tweets_page(
+    session: AsyncSession, link, where, limit: int, cursor: Optional[str]
+) -> bytes:
+    """Response body of a newest-first page of tweets found via ``link``.
+
+    ``link`` is a lookup table with a ``tweet_id`` column (hashtags,
+    mentions); pages are keyed on that column so the lookup index serves
+    both the filter and the order.
+    """
+    stmt = (
+        page_rows([Tweet.id])
+        .join(link, link.tweet_id == Tweet.id)
+        .where(where)
+        .order_by(desc(link.tweet_id))
+        .limit(limit + 1)
+    )
+    after = decode_cursor(cursor, (int,))
+    if after:
+        stmt = stmt.where(link.tweet_id < after[0])
+    result = await session.execute(stmt)
+    tweets, has_more = split_page(result.all(), limit)
+    fragments = await tweet_fragments(session, tweets)
+    return feed_body(fragments, encode_cursor(tweets[-1].id) if has_more else None)
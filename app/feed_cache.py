@@ -0,0 +1,159 @@
+from collections import defaultdict
+from time import monotonic
+from typing import Hashable, Iterable, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import CacheBackend, TTLCache
+from app.events import bus, publish_after_commit
+from app.graph import follower_ids
+from db.engine import settings
+from db.models import User
+
+
+class FeedCache:
+    """Rendered home-feed pages per user, invalidated write-through.
+
+    The backend maps ``user_id`` to that user's cached pages
+    ``{params: (stored_at, payload, tweet_ids)}``, so one ``pop`` drops every
+    page of a user. A local reverse index ``tweet_id -> user_ids`` lets a
+    like or delete find exactly the feeds that show the tweet; the
+    backend's evictions are reported to ``forget`` to keep it in step.
+
+    Every ``put`` re-stores the user's dict and so renews the backend TTL
+    of all their pages; ``get`` therefore checks each page's own
+    ``stored_at`` against FEED_CACHE_TTL.
+    """
+
+    def __init__(self, pages_per_user: int, backend: Optional[CacheBackend] = None):
+        self.backend = backend or TTLCache(
+            settings.FEED_CACHE_SIZE, settings.FEED_CACHE_TTL
+        )
+        self.backend.on_evict = self.forget
+        self.pages_per_user = pages_per_user
+        self._by_tweet: "defaultdict[int, set]" = defaultdict(set)
+        # users invalidated recently, to refuse fills that raced a write
+        self._invalidated = TTLCache(100_000, ttl=settings.FEED_CACHE_TTL)
+        self._clock = 0
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self._age_total = 0.0
+        self.max_age = 0.0
+
+    @property
+    def enabled(self) -> bool:
+        return settings.FEED_CACHE_SIZE > 0
+
+    def token(self) -> int:
+        """Taken before reading the database; see ``put``."""
+        return self._clock
+
+    def get(self, user_id: int, params: Hashable) -> Optional[dict]:
+        pages = self.backend.get(user_id) or {}
+        entry = pages.get(params)
+        age = monotonic() - entry[0] if entry is not None else 0.0
+        if entry is None or age > settings.FEED_CACHE_TTL:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._age_total += age
+        self.max_age = max(self.max_age, age)
+        return entry[1]
+
+    def put(
+        self, user_id: int, params: Hashable, payload: bytes, tweet_ids, token: int
+    ) -> None:
+        # a write committed while this page was being built; it may be stale
+        if self._invalidated.get(user_id, -1) > token:
+            return
+        pages = dict(self.backend.get(user_id) or {})
+        if len(pages) >= self.pages_per_user and params not in pages:
+            pages.pop(next(iter(pages)))
+        pages[params] = (monotonic(), payload, tuple(tweet_ids))
+        self.backend.set(user_id, pages)
+        for tweet_id in tweet_ids:
+            self._by_tweet[tweet_id].add(user_id)
+
+    def forget(self, user_id: int, pages: Optional[dict]) -> None:
+        for _, _, tweet_ids in (pages or {}).values():
+            for tweet_id in tweet_ids:
+                users = self._by_tweet.get(tweet_id)
+                if users is not None:
+                    users.discard(user_id)
+                    if not users:
+                        del self._by_tweet[tweet_id]
+
+    def invalidate_users(self, user_ids: Iterable[int]) -> None:
+        self._clock += 1
+        for user_id in user_ids:
+            self._invalidated.set(user_id, self._clock)
+            self.forget(user_id, self.backend.pop(user_id))
+            self.invalidations += 1
+
+    def invalidate_tweet(self, tweet_id: int) -> None:
+        self.invalidate_users(list(self._by_tweet.get(tweet_id, ())))
+
+    def clear(self) -> None:
+        self.backend.clear()
+        self._by_tweet.clear()
+        self._invalidated.clear()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "tracked_tweets": len(self._by_tweet),
+            # age of pages when served: how stale a hit can be
+            "staleness_avg_s": round(self._age_total / self.hits, 3)
+            if self.hits
+            else 0.0,
+            "staleness_max_s": round(self.max_age, 3),
+            "backend": self.backend.stats(),
+        }
+
+
+feed_cache = FeedCache(settings.FEED_CACHE_PAGES_PER_USER)
+
+# every worker keeps its own pages: invalidations go through the event bus
+bus.on("feed_users", lambda event: feed_cache.invalidate_users(event["user_ids"]))
+bus.on("feed_tweet", lambda event: feed_cache.invalidate_tweet(event["tweet_id"]))
+bus.on("reset", lambda event: feed_cache.clear())
+
+
+async def invalidate_author_feeds(session: AsyncSession, author_id: int) -> None:
+    """A tweet by ``author_id`` appeared or vanished: drop the author's and
+    their followers' pages once the transaction commits.
+
+    Followers of an author at or above FANOUT_MAX_FOLLOWERS are left alone:
+    listing them and relaying one id per follower to every worker costs
+    more than the pages save, and those pages age out after FEED_CACHE_TTL.
+    """
+    if not feed_cache.enabled:
+        return
+    result = await session.execute(
+        select(User.followers_count).where(User.id == author_id)
+    )
+    user_ids = [author_id]
+    if (result.scalar() or 0) < settings.FANOUT_MAX_FOLLOWERS:
+        user_ids += await follower_ids(session, author_id)
+    publish_after_commit(session, {"type": "feed_users", "user_ids": user_ids})
+
+
+def invalidate_tweet_feeds(session: AsyncSession, tweet_id: int) -> None:
+    """Drop every cached feed that rendered ``tweet_id``.
+
+    A like can also lift a tweet into a page that never showed it; such
+    pages are not tracked and age out after FEED_CACHE_TTL.
+    """
+    if feed_cache.enabled:
+        publish_after_commit(session, {"type": "feed_tweet", "tweet_id": tweet_id})
+
+
+def invalidate_user_feed(session: AsyncSession, user_id: int) -> None:
+    if feed_cache.enabled:
+        publish_after_commit(session, {"type": "feed_users", "user_ids": [user_id]})
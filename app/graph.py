@@ -0,0 +1,165 @@
+from array import array
+from bisect import bisect_left
+from collections import OrderedDict
+from time import monotonic
+from typing import Dict, Optional
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.cache import TTLCache
+from app.events import bus
+from db.engine import settings
+from db.models import Follower
+
+FOLLOWING = "following"
+FOLLOWERS = "followers"
+
+# direction -> (column holding the owner, column holding the neighbours)
+_COLUMNS = {
+    FOLLOWING: (Follower.follower_id, Follower.following_id),
+    FOLLOWERS: (Follower.following_id, Follower.follower_id),
+}
+
+
+class FollowGraph:
+    """Per-user sorted id arrays of followees and followers.
+
+    An LRU bounded by the total number of ids held, not by users, so a
+    few very popular accounts cannot blow the budget; a list longer than
+    ``max_ids`` is never cached. Lists are loaded on a miss and then kept
+    current by the ``follow`` events every worker receives; a ``reset``
+    (events were lost) clears them all, and each list is reloaded after
+    ``ttl`` seconds in any case.
+    """
+
+    def __init__(self, max_ids: int, ttl: Optional[float] = None):
+        self.max_ids = max_ids
+        self.ttl = ttl
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._lists: "OrderedDict[tuple, array]" = OrderedDict()
+        self._loaded_at: Dict[tuple, float] = {}
+        # users whose edges changed recently, to refuse loads that raced them
+        self._changed = TTLCache(100_000, ttl=ttl)
+        self._clock = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_ids > 0
+
+    def get(self, direction: str, user_id: int) -> Optional[array]:
+        key = (direction, user_id)
+        ids = self._lists.get(key)
+        if ids is not None and self.ttl is not None:
+            if monotonic() - self._loaded_at[key] > self.ttl:
+                self._drop(key)
+                ids = None
+        if ids is None:
+            self.misses += 1
+            return None
+        self._lists.move_to_end(key)
+        self.hits += 1
+        return ids
+
+    def token(self) -> int:
+        """Taken before reading the database; see ``put``."""
+        return self._clock
+
+    def put(self, direction: str, user_id: int, ids, token: int) -> None:
+        # a follow or unfollow landed while the list was being read
+        if self._changed.get(user_id, -1) > token:
+            return
+        ids = array("q", sorted(ids))
+        if len(ids) > self.max_ids:
+            return
+        self._drop((direction, user_id))
+        self._lists[(direction, user_id)] = ids
+        self._loaded_at[(direction, user_id)] = monotonic()
+        self.size += len(ids)
+        self._shrink()
+
+    def _drop(self, key: tuple) -> None:
+        ids = self._lists.pop(key, None)
+        if ids is not None:
+            self.size -= len(ids)
+            del self._loaded_at[key]
+
+    def _shrink(self) -> None:
+        while self.size > self.max_ids:
+            self._drop(next(iter(self._lists)))
+
+    def _edge(self, direction: str, user_id: int, other_id: int, active: bool) -> None:
+        ids = self._lists.get((direction, user_id))
+        if ids is None:
+            return
+        at = bisect_left(ids, other_id)
+        present = at < len(ids) and ids[at] == other_id
+        if active and not present:
+            ids.insert(at, other_id)
+            self.size += 1
+        elif not active and present:
+            del ids[at]
+            self.size -= 1
+
+    def apply(self, follower_id: int, following_id: int, active: bool) -> None:
+        self._clock += 1
+        self._changed.set(follower_id, self._clock)
+        self._changed.set(following_id, self._clock)
+        self._edge(FOLLOWING, follower_id, following_id, active)
+        self._edge(FOLLOWERS, following_id, follower_id, active)
+        self._shrink()
+
+    def clear(self) -> None:
+        self._lists.clear()
+        self._loaded_at.clear()
+        self._changed.clear()
+        self.size = 0
+
+    def stats(self) -> dict:
+        return {
+            "lists": len(self._lists),
+            "ids": self.size,
+            "max_ids": self.max_ids,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+follow_graph = FollowGraph(settings.FOLLOW_GRAPH_CACHE_IDS, settings.FOLLOW_GRAPH_TTL)
+
+# follow_user/unfollow_user publish after commit; every worker patches its copy
+bus.on(
+    "follow",
+    lambda event: follow_graph.apply(
+        event["follower_id"], event["following_id"], event["active"]
+    ),
+)
+# dispatched by the relay after a reconnect or when peers dropped events
+bus.on("reset", lambda event: follow_graph.clear())
+
+
+async def _neighbours(session: AsyncSession, direction: str, user_id: int) -> array:
+    ids = follow_graph.get(direction, user_id) if follow_graph.enabled else None
+    if ids is not None:
+        return ids
+    token = follow_graph.token()
+    owner, other = _COLUMNS[direction]
+    result = await session.execute(
+        select(other).where(owner == user_id).order_by(other)
+    )
+    ids = array("q", result.scalars())
+    if follow_graph.enabled:
+        follow_graph.put(direction, user_id, ids, token)
+    return ids
+
+
+async def following_ids(session: AsyncSession, user_id: int) -> array:
+    """Sorted ids of the users ``user_id`` follows."""
+    return await _neighbours(session, FOLLOWING, user_id)
+
+
+async def follower_ids(session: AsyncSession, user_id: int) -> array:
+    """Sorted ids of the users following ``user_id``."""
+    return await _neighbours(session, FOLLOWERS, user_id)
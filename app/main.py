@@ -1,12 +1,74 @@
 import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI, Depends
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
-from app.routers import users, tweets, medias
-from app.middleware import api_key_auth
+from fastapi.responses import FileResponse, JSONResponse
+from sqlalchemy.engine import make_url
+from app.routers import users, tweets, medias, live, tags, trends
+from app.events import PgNotifyBridge, bus
+from app.counters import like_flusher
+from app.trends import trend_checkpointer
+from app.middleware import api_key_auth, auth_cache
+from app.feed import fragment_cache
+from app.feed_cache import feed_cache
+from app.graph import follow_graph
+from app.responses import FastJSONResponse
+from app.storage import hot_files, media_sweeper
+from app.thumbnails import workers as thumbnail_workers
+from app.timeline import timeline_backfiller
+from db.engine import pool_status, settings
 
-app = FastAPI(title="Microblog Service", version="1.0.0")
+
+def notify_bridge():
+    """LISTEN/NOTIFY relay for live events, or None off Postgres."""
+    url = make_url(settings.LIVE_NOTIFY_URL or settings.DATABASE_URL)
+    if not settings.LIVE_NOTIFY or url.get_backend_name() != "postgresql":
+        return None
+    dsn = url.set(drivername="postgresql").render_as_string(hide_password=False)
+    return PgNotifyBridge(bus, dsn, settings.LIVE_NOTIFY_CHANNEL)
+
+
+def check_workers(bridge) -> None:
+    """Worker-local state is only coherent across workers through the relay.
+
+    Auth, feed and hot-file caches, and live connections, are kept in each
+    process and invalidated through ``app.events.bus``; without a relay a
+    second worker would serve stale entries until they expire.
+    """
+    if settings.WORKERS > 1 and bridge is None:
+        raise RuntimeError(
+            f"WORKERS={settings.WORKERS} needs the LISTEN/NOTIFY relay: "
+            "use a Postgres DATABASE_URL with LIVE_NOTIFY enabled, or WORKERS=1"
+        )
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    bridge = notify_bridge()
+    check_workers(bridge)
+    if bridge is not None:
+        bridge.start()
+    like_flusher.start()
+    media_sweeper.start()
+    timeline_backfiller.start()
+    await trend_checkpointer.start()
+    yield
+    await trend_checkpointer.stop()
+    await timeline_backfiller.stop()
+    await media_sweeper.stop()
+    await like_flusher.stop()
+    if bridge is not None:
+        await bridge.stop()
+    thumbnail_workers.shutdown()
+
+
+app = FastAPI(
+    title="Microblog Service",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=FastJSONResponse if settings.FAST_JSON else JSONResponse,
+)
 
 app.add_middleware(
     CORSMiddleware,
@@ -35,6 +97,10 @@ app.include_router(users.router, prefix="/api")
 # Остальные С АВТОРИЗАЦИЕЙ
 app.include_router(tweets.router, prefix="/api", dependencies=[Depends(api_key_auth)])
 app.include_router(medias.router, prefix="/api", dependencies=[Depends(api_key_auth)])
+app.include_router(tags.router, prefix="/api", dependencies=[Depends(api_key_auth)])
+app.include_router(trends.router, prefix="/api", dependencies=[Depends(api_key_auth)])
+# api-key проверяется внутри: EventSource не умеет слать заголовки
+app.include_router(live.router, prefix="/api")
 
 
 @app.get("/")
@@ -43,4 +109,13 @@ async def root():
 
 @app.get("/health")
 async def health():
-    return {"status": "healthy"}
+    return {
+        "status": "healthy",
+        "db_pool": pool_status(),
+        "auth_cache": auth_cache.stats(),
+        "feed_cache": feed_cache.stats(),
+        "fragment_cache": fragment_cache.stats(),
+        "follow_graph": follow_graph.stats(),
+        "media_hot_cache": hot_files.stats(),
+        "live": bus.stats(),
+    }
@@ -1,19 +1,62 @@
+from dataclasses import dataclass
 from fastapi import Header, Depends, HTTPException
 from fastapi.security import APIKeyHeader
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
-from db.engine import get_async_session
+from app.cache import TTLCache
+from app.events import bus
+from db.engine import get_async_session, settings
 from db.models import User
 
 api_key_scheme = APIKeyHeader(name="api-key", auto_error=False)
 
 
+@dataclass(frozen=True)
+class AuthUser:
+    """Detached identity of the caller; safe to keep across requests."""
+
+    id: int
+    username: str
+    api_key: str
+
+
+auth_cache = TTLCache(settings.AUTH_CACHE_SIZE, settings.AUTH_CACHE_TTL)
+
+
+def invalidate_api_key(api_key: str) -> None:
+    auth_cache.pop(api_key)
+
+
+def invalidate_user(user_id: int) -> None:
+    auth_cache.discard_where(lambda identity: identity.id == user_id)
+
+
+# other workers learn about changed keys by user id, never by the key itself
+bus.on("auth_user", lambda event: invalidate_user(event["user_id"]))
+bus.on("reset", lambda event: auth_cache.clear())
+
+
 async def api_key_auth(
     api_key: str = Depends(api_key_scheme),
     session: AsyncSession = Depends(get_async_session),
-):
-    result = await session.execute(select(User).where(User.api_key == api_key))
-    user = result.scalar_one_or_none()
-    if not user:
+) -> AuthUser:
+    return await authenticate(session, api_key)
+
+
+async def authenticate(session: AsyncSession, api_key: str | None) -> AuthUser:
+    if not api_key:
+        raise HTTPException(401, "Invalid API key")
+    identity = auth_cache.get(api_key)
+    if identity is not None:
+        return identity
+
+    result = await session.execute(
+        select(User.id, User.username).where(User.api_key == api_key)
+    )
+    row = result.first()
+    if not row:
         raise HTTPException(401, "Invalid API key")
-    return user
+    identity = AuthUser(id=row.id, username=row.username, api_key=api_key)
+    auth_cache.set(api_key, identity)
+    return identity
+
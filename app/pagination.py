@@ -0,0 +1,63 @@
+import base64
+import json
+from datetime import datetime
+from typing import Any, List, Optional, Sequence
+
+from fastapi import HTTPException, status
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def _to_json(value: Any) -> Any:
+    if isinstance(value, datetime):
+        return {"dt": value.isoformat()}
+    return value
+
+
+def _from_json(value: Any, kind: type) -> Any:
+    """``value`` as ``kind``; ValueError when it is anything else."""
+    if kind is datetime:
+        if not isinstance(value, dict) or not isinstance(value.get("dt"), str):
+            raise ValueError(value)
+        return datetime.fromisoformat(value["dt"])
+    # bool is an int to Python, never to the database
+    if isinstance(value, bool):
+        raise ValueError(value)
+    if kind is float and isinstance(value, (int, float)):
+        return float(value)
+    if kind is int and isinstance(value, int):
+        return value
+    raise ValueError(value)
+
+
+def encode_cursor(*values: Any) -> str:
+    """Pack a keyset sort key into an opaque url-safe token."""
+    raw = json.dumps([_to_json(v) for v in values], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+
+def decode_cursor(
+    cursor: Optional[str], types: Sequence[type]
+) -> Optional[List[Any]]:
+    """Unpack a token produced by ``encode_cursor``; 400 on anything malformed.
+
+    ``types`` are the Python types of the sort columns (int, float or
+    datetime), checked here so a forged cursor never reaches the query.
+    """
+    if not cursor:
+        return None
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            raise ValueError(cursor)
+        return [_from_json(v, kind) for v, kind in zip(values, types)]
+    except (ValueError, TypeError):
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Invalid cursor")
+
+
+def split_page(rows: Sequence, limit: int):
+    """Rows are fetched with ``limit + 1``; the extra one only signals a next page."""
+    has_more = len(rows) > limit
+    return list(rows[:limit]), has_more
@@ -0,0 +1,30 @@
+import math
+from datetime import datetime
+
+from sqlalchemy import case, func
+
+from db.engine import settings
+
+# scores count decay periods from here; keeps the stored floats small
+RANK_EPOCH = datetime(2026, 1, 1)
+
+
+def hot_score(likes: int, created_at: datetime) -> float:
+    """ln(likes) plus one point per FEED_RANK_DECAY seconds of recency.
+
+    Age is folded in as a bonus for being newer instead of a penalty that
+    grows with time, so a stored score never goes stale: it only has to
+    change when the like count does.
+    """
+    age = (created_at - RANK_EPOCH).total_seconds()
+    return math.log(max(likes, 1)) + age / settings.FEED_RANK_DECAY
+
+
+def _ln_likes(likes):
+    return func.ln(case((likes > 1, likes), else_=1))
+
+
+def rescored(score, old_likes, new_likes):
+    """SQL for the score after likes move from ``old_likes`` to ``new_likes``;
+    the recency part of the stored score is kept as is."""
+    return score - _ln_likes(old_likes) + _ln_likes(new_likes)
@@ -0,0 +1,52 @@
+import json
+from datetime import date, datetime
+from typing import Any
+
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from sqlalchemy.engine import Row
+
+try:
+    import orjson
+except ImportError:  # stdlib fallback, same output
+    orjson = None
+
+
+def _default(value: Any) -> Any:
+    """Types the encoders do not know natively.
+
+    Pydantic models and SQLAlchemy rows are dumped here, so handlers may
+    return them inside a ``FastJSONResponse`` without ``jsonable_encoder``.
+    """
+    if isinstance(value, BaseModel):
+        return value.model_dump(mode="json")
+    if isinstance(value, Row):
+        return value._asdict()
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+if orjson is not None:
+
+    def dumps(value: Any) -> bytes:
+        return orjson.dumps(value, default=_default, option=orjson.OPT_NON_STR_KEYS)
+
+else:
+
+    def dumps(value: Any) -> bytes:
+        return json.dumps(
+            value, default=_default, ensure_ascii=False, separators=(",", ":")
+        ).encode()
+
+
+class FastJSONResponse(JSONResponse):
+    """Compact UTF-8 JSON, encoded by orjson when it is installed.
+
+    As the app default it only replaces the final ``json.dumps``; a handler
+    that returns ``FastJSONResponse(payload)`` itself also skips FastAPI's
+    ``jsonable_encoder`` pass.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
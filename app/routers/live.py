@@ -0,0 +1,61 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, status
+from fastapi.responses import StreamingResponse
+from sqlalchemy import desc, select
+
+import db.engine
+from app.events import Subscription, bus
+from app.middleware import api_key_scheme, authenticate
+from app.responses import dumps
+from db.engine import settings
+from db.models import Follower
+
+router = APIRouter(prefix="/live", tags=["live"])
+
+
+async def _stream(request: Request, subscription: Subscription):
+    try:
+        yield b"retry: 3000\n\n"
+        while not await request.is_disconnected():
+            event = await subscription.next(settings.LIVE_HEARTBEAT)
+            if event is None:
+                yield b": ping\n\n"
+                continue
+            yield b"event: %s\ndata: %s\n\n" % (event["type"].encode(), dumps(event))
+    finally:
+        bus.unsubscribe(subscription)
+
+
+@router.get("/")
+async def live_feed(
+    request: Request,
+    header_key: Optional[str] = Depends(api_key_scheme),
+    api_key: Optional[str] = Query(None),
+):
+    """Server-sent ``tweet`` and ``likes`` events from the followed authors.
+
+    EventSource cannot set headers, so the key may also come as
+    ``?api_key=``. A ``resync`` event means events were dropped and the
+    client should refetch its feed.
+    """
+    # a short session of its own: the stream must not pin a pool connection
+    async with db.engine.AsyncSessionLocal() as session:
+        user = await authenticate(session, header_key or api_key)
+        result = await session.execute(
+            select(Follower.following_id)
+            .where(Follower.follower_id == user.id)
+            .order_by(desc(Follower.id))
+            .limit(settings.LIVE_MAX_AUTHORS)
+        )
+        authors = result.scalars().all()
+
+    # newest follows came first; the bus wants follow order
+    subscription = bus.subscribe(user.id, reversed(authors))
+    if subscription is None:
+        raise HTTPException(status.HTTP_429_TOO_MANY_REQUESTS, "Too many live connections")
+    return StreamingResponse(
+        _stream(request, subscription),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,38 +1,81 @@
-from fastapi import APIRouter, Depends, status, UploadFile, File, HTTPException
+from fastapi import APIRouter, Depends, Request, status, HTTPException
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy import select
 from typing import List
-from db.engine import get_async_session
-from db.models import Media, User
-from app.middleware import api_key_auth
+from db.engine import get_async_session, settings
+from db.models import Media
+from app.middleware import AuthUser, api_key_auth
+from app.cache import TTLCache
+from app.thumbnails import ensure_variant, variant_path, workers
+from app.storage import (
+    check_upload_length,
+    content_etag,
+    hash_file,
+    hot_files,
+    resolve_media_path,
+    save_upload,
+    upload_extension,
+)
+import mimetypes
 import os
-import uuid
+import re
+import stat
 from datetime import datetime
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, Response
+from starlette.concurrency import run_in_threadpool
+
+# names are content hashes or uuids, so a stored file never changes
+IMMUTABLE = "public, max-age=31536000, immutable"
+# the original standing in for a variant that is not rendered yet
+PROVISIONAL = "no-cache"
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+# sha256 of pre-content-addressing files, keyed by (path, mtime, size)
+legacy_etags = TTLCache(10_000)
 
 router = APIRouter(prefix="/medias", tags=["medias"])
 
 
-async def get_current_user(user: User = Depends(api_key_auth)):
+async def get_current_user(user: AuthUser = Depends(api_key_auth)):
     return user
 
 
-@router.post("/", status_code=status.HTTP_201_CREATED)
+# the form is parsed in the handler, after the Content-Length check
+_UPLOAD_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+
+@router.post("/", status_code=status.HTTP_201_CREATED, openapi_extra=_UPLOAD_BODY)
 async def create_media(
-    file: UploadFile = File(...),
-    user: User = Depends(get_current_user),
+    request: Request,
+    user: AuthUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_async_session),
 ):
-    os.makedirs("media", exist_ok=True)
-    file_extension = file.filename.split(".")[-1]
-    filename = f"{uuid.uuid4()}.{file_extension}"
-    file_path = f"media/{filename}"
+    check_upload_length(request.headers.get("content-length"))
+    async with request.form(max_files=1) as form:
+        file = form.get("file")
+        if file is None or isinstance(file, str):
+            raise HTTPException(
+                status.HTTP_422_UNPROCESSABLE_ENTITY, "Missing file field"
+            )
+        extension = upload_extension(file.filename, file.content_type)
+        stored = await save_upload(file, extension)
 
-    content = await file.read()
-    with open(file_path, "wb") as buffer:
-        buffer.write(content)
+    workers.schedule(stored.path)
 
-    media = Media(url=f"/medias/{filename}")
+    media = Media(url=stored.url, content_hash=stored.sha256)
     session.add(media)
     await session.flush()
     return {"result": True, "media_id": media.id}
@@ -40,7 +83,7 @@ async def create_media(
 
 @router.get("/", status_code=status.HTTP_200_OK)
 async def get_medias(
-    user: User = Depends(get_current_user),
+    user: AuthUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_async_session),
 ):
     result = await session.execute(select(Media).where(Media.tweet_id.is_(None)))
@@ -48,9 +91,92 @@ async def get_medias(
     return {"result": True, "medias": [{"id": m.id, "url": m.url} for m in medias]}
 
 
+async def _etag(path: str, st: os.stat_result) -> str:
+    etag = content_etag(path)
+    if etag:
+        return etag
+    key = (path, st.st_mtime_ns, st.st_size)
+    etag = legacy_etags.get(key)
+    if etag is None:
+        etag = f'"{await run_in_threadpool(hash_file, path)}"'
+        legacy_etags.set(key, etag)
+    return etag
+
+
+def _etag_matches(header: str | None, etag: str) -> bool:
+    if not header:
+        return False
+    candidates = [c.strip().removeprefix("W/") for c in header.split(",")]
+    return "*" in candidates or etag in candidates
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _bytes_response(request: Request, body: bytes, headers: dict, media_type):
+    """Serve a cached body, honouring a single byte range like FileResponse."""
+    headers["Accept-Ranges"] = "bytes"
+    range_header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    match = _RANGE.match(range_header or "")
+    if not match or (if_range and if_range != headers["ETag"]):
+        return Response(body, headers=headers, media_type=media_type)
+
+    size = len(body)
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+    elif last:
+        start, end = max(size - int(last), 0), size - 1
+    else:
+        start, end = size, 0
+    if start > end:
+        return Response(
+            status_code=416, headers={"Content-Range": f"bytes */{size}"}
+        )
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(
+        body[start : end + 1], status_code=206, headers=headers, media_type=media_type
+    )
+
+
 @router.get("/{filename:path}")
-async def get_media_file(filename: str):
-    file_path = f"media/{filename}"
-    if os.path.exists(file_path):
-        return FileResponse(file_path)
-    raise HTTPException(status_code=404, detail="Media not found")
+async def get_media_file(filename: str, request: Request, w: int | None = None):
+    path = resolve_media_path(filename)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Media not found")
+    # ?w= picks a resized variant; until it is rendered the original is served
+    cache_control = IMMUTABLE
+    if w in settings.MEDIA_VARIANT_WIDTHS:
+        variant = variant_path(path, w)
+        path = variant if variant in hot_files else await ensure_variant(path, w)
+        if path != variant:
+            # the variant url must not keep the full-size body for a year
+            cache_control = PROVISIONAL
+
+    cached = hot_files.get(path)
+    if cached:
+        etag, body = cached
+    else:
+        try:
+            st = await run_in_threadpool(os.stat, path)
+        except OSError:
+            st = None
+        if st is None or not stat.S_ISREG(st.st_mode):
+            raise HTTPException(status_code=404, detail="Media not found")
+        etag = await _etag(path, st)
+        body = None
+        if st.st_size <= hot_files.max_file_bytes:
+            body = await run_in_threadpool(_read_file, path)
+            hot_files.put(path, etag, body)
+
+    headers = {"ETag": etag, "Cache-Control": cache_control}
+    if _etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    media_type = mimetypes.guess_type(path)[0] or "application/octet-stream"
+    if body is not None:
+        return _bytes_response(request, body, headers, media_type)
+    return FileResponse(path, headers=headers, media_type=media_type, stat_result=st)
@@ -0,0 +1,26 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Path, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.feed import linked_tweets_page
+from app.pagination import DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE
+from db.engine import get_async_session
+from db.models import TweetHashtag
+
+router = APIRouter(prefix="/tags", tags=["tags"])
+
+
+@router.get("/{tag}/tweets")
+async def get_tag_tweets(
+    tag: str = Path(..., max_length=100),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Tweets with ``#tag`` (with or without the ``#``), newest first."""
+    tag = tag.lstrip("#").lower()
+    body = await linked_tweets_page(
+        session, TweetHashtag, TweetHashtag.tag == tag, limit, cursor
+    )
+    return Response(body, media_type="application/json")
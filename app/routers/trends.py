@@ -0,0 +1,26 @@
+from fastapi import APIRouter, Query
+
+from app.trends import trending_tags, trending_tweets
+from db.engine import settings
+
+router = APIRouter(prefix="/trends", tags=["trends"])
+
+
+@router.get("/")
+async def get_trends(limit: int = Query(10, ge=1, le=settings.TRENDS_TOP_K)):
+    """Most used hashtags and most liked tweets over the last TRENDS_WINDOW.
+
+    Counts are count-min estimates: never lower than the truth and only
+    slightly higher for the top entries.
+    """
+    return {
+        "result": True,
+        "window_seconds": settings.TRENDS_WINDOW,
+        "tags": [
+            {"tag": tag, "count": count} for tag, count in trending_tags.ranked(limit)
+        ],
+        "tweets": [
+            {"tweet_id": tweet_id, "likes": count}
+            for tweet_id, count in trending_tweets.ranked(limit)
+        ],
+    }
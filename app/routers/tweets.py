@@ -1,12 +1,30 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select, desc
-from typing import List, Optional
-from db.engine import get_async_session
-from db.models import Tweet, User, Follower, Media, Like
-from app.middleware import api_key_auth
-from sqlalchemy.orm import selectinload
-from pydantic import BaseModel
+from sqlalchemy import select, desc, tuple_, delete, exists, literal, insert, update, case
+from typing import Dict, List, Literal, Optional
+from db.engine import get_async_session, settings, upsert
+from db.models import Tweet, Media, Like
+from app.middleware import AuthUser, api_key_auth
+from app import graph, search, tags, timeline
+from app.counters import add_likes
+from app.events import publish_after_commit
+from app.feed import FEED_ORDERS, feed_body, page_rows, tweet_fragments
+from app.feed_cache import (
+    feed_cache,
+    invalidate_author_feeds,
+    invalidate_tweet_feeds,
+)
+from app.ranking import hot_score
+from app.storage import release_files
+from app.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+    split_page,
+)
+from pydantic import BaseModel, Field
+from datetime import datetime
 
 
 class TweetCreate(BaseModel):
@@ -19,132 +37,313 @@ class TweetResponse(BaseModel):
     tweet_id: int
 
 
+class TweetBatch(BaseModel):
+    tweets: List[TweetCreate] = Field(
+        ..., min_length=1, max_length=settings.TWEET_BATCH_MAX_SIZE
+    )
+
+
+class TweetBatchResponse(BaseModel):
+    result: bool
+    tweet_ids: List[int]
+
+
 router = APIRouter(prefix="/tweets", tags=["tweets"])
 
 
-async def get_current_user(user: User = Depends(api_key_auth)):
+async def get_current_user(user: AuthUser = Depends(api_key_auth)):
     return user
 
 
+async def _attach_medias(session: AsyncSession, owners: Dict[int, int]) -> List[int]:
+    """Point unattached medias at their tweets in one UPDATE ... RETURNING.
+
+    ``owners`` maps media id -> tweet id; ids that do not exist or already
+    belong to a tweet are skipped. Returns the ids actually attached.
+    """
+    if not owners:
+        return []
+    targets = set(owners.values())
+    result = await session.execute(
+        update(Media)
+        .where(Media.id.in_(list(owners)), Media.tweet_id.is_(None))
+        .values(
+            tweet_id=(
+                targets.pop() if len(targets) == 1 else case(owners, value=Media.id)
+            )
+        )
+        .returning(Media.id)
+        .execution_options(synchronize_session=False)
+    )
+    return list(result.scalars())
+
+
 @router.post("/", response_model=TweetResponse, status_code=status.HTTP_201_CREATED)
 async def create_tweet(
     tweet: TweetCreate,
-    user: User = Depends(get_current_user),
+    user: AuthUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_async_session),
 ):
-    tweet_obj = Tweet(content=tweet.tweet_data, author_id=user.id)
-    session.add(tweet_obj)
-    await session.flush()
-    await session.refresh(tweet_obj)
+    now = datetime.now()
+    tweet_id = await session.scalar(
+        insert(Tweet)
+        .values(
+            content=tweet.tweet_data,
+            author_id=user.id,
+            created_at=now,
+            score=hot_score(0, now),
+        )
+        .returning(Tweet.id)
+    )
+    await timeline.push_tweet(session, tweet_id, user.id)
+    await invalidate_author_feeds(session, user.id)
+    contents = [(tweet_id, tweet.tweet_data)]
+    _publish_tweets(session, contents, user.id)
+    search.index_tweets(session, contents)
+    await tags.record_tweets(session, contents)
+    await _attach_medias(
+        session, {media_id: tweet_id for media_id in tweet.tweet_media_ids or []}
+    )
 
-    if tweet.tweet_media_ids:
-        for media_id in tweet.tweet_media_ids:
-            media = await session.get(Media, media_id)
-            if media:
-                media.tweet_id = tweet_obj.id
-        await session.flush()
+    return {"result": True, "tweet_id": tweet_id}
 
-    return {"result": True, "tweet_id": tweet_obj.id}
+
+@router.post(
+    "/batch", response_model=TweetBatchResponse, status_code=status.HTTP_201_CREATED
+)
+async def create_tweets_batch(
+    batch: TweetBatch,
+    user: AuthUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Many tweets and their attachments in one transaction, for importers."""
+    now = datetime.now()
+    score = hot_score(0, now)
+    result = await session.execute(
+        insert(Tweet).returning(Tweet.id, sort_by_parameter_order=True),
+        [
+            {
+                "content": tweet.tweet_data,
+                "author_id": user.id,
+                "created_at": now,
+                "score": score,
+            }
+            for tweet in batch.tweets
+        ],
+    )
+    tweet_ids = list(result.scalars())
+    await timeline.push_tweets(session, tweet_ids, user.id)
+    await invalidate_author_feeds(session, user.id)
+    contents = [(i, tweet.tweet_data) for i, tweet in zip(tweet_ids, batch.tweets)]
+    _publish_tweets(session, contents, user.id)
+    search.index_tweets(session, contents)
+    await tags.record_tweets(session, contents)
+
+    # a media listed under several tweets goes to the first one
+    owners: Dict[int, int] = {}
+    for tweet_id, tweet in zip(tweet_ids, batch.tweets):
+        for media_id in tweet.tweet_media_ids or []:
+            owners.setdefault(media_id, tweet_id)
+    await _attach_medias(session, owners)
+
+    return {"result": True, "tweet_ids": tweet_ids}
 
 
 @router.get("/")
 async def get_tweets_feed(
-    user: User = Depends(get_current_user),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    mode: Literal["popular", "latest", "ranked"] = "popular",
+    variant: Optional[int] = None,
+    user: AuthUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_async_session),
 ):
-    following_stmt = select(Follower.following_id).where(
-        Follower.follower_id == user.id
-    )
-    following_result = await session.execute(following_stmt)
-    following_ids = [row[0] for row in following_result.fetchall()]
-
-    stmt = (
-        select(Tweet)
-        .options(
-            selectinload(Tweet.medias),
-            selectinload(Tweet.author),
-            selectinload(Tweet.likes).selectinload(Like.user),
+    if variant is not None and variant not in settings.MEDIA_VARIANT_WIDTHS:
+        raise HTTPException(status.HTTP_400_BAD_REQUEST, "Unknown media variant")
+
+    params = (mode, cursor, limit, variant)
+    if feed_cache.enabled:
+        cached = feed_cache.get(user.id, params)
+        if cached is not None:
+            return Response(cached, media_type="application/json")
+    token = feed_cache.token()
+
+    # id is the tiebreaker: the sort key stays unique while likes move
+    order = FEED_ORDERS[mode]
+    after = decode_cursor(cursor, [column.type.python_type for column in order])
+    if settings.FEED_FANOUT:
+        keys, has_more = split_page(
+            await timeline.feed_keys(session, user.id, order, limit + 1, after), limit
         )
-        .where(Tweet.author_id.in_(following_ids + [user.id]))
-        .order_by(desc(Tweet.likes_count), desc(Tweet.created_at))
-    )
+        result = await session.execute(
+            page_rows(order).where(Tweet.id.in_([key[-1] for key in keys]))
+        )
+        found = {row.id: row for row in result}
+        tweets = [found[key[-1]] for key in keys if key[-1] in found]
+    else:
+        following_ids = await graph.following_ids(session, user.id)
+        stmt = (
+            page_rows(order)
+            .where(Tweet.author_id.in_([*following_ids, user.id]))
+            .order_by(*[desc(column) for column in order])
+            .limit(limit + 1)
+        )
+        if after:
+            stmt = stmt.where(tuple_(*order) < tuple_(*after))
+        result = await session.execute(stmt)
+        tweets, has_more = split_page(result.all(), limit)
+        keys = [[getattr(row, column.key) for column in order] for row in tweets]
+    fragments = await tweet_fragments(session, tweets, variant)
 
-    result = await session.execute(stmt)
-    tweets = result.scalars().all()
+    next_cursor = encode_cursor(*keys[-1]) if has_more else None
 
-    tweets_data = []
-    for tweet in tweets:
-        tweets_data.append(
-            {
-                "id": tweet.id,
-                "content": tweet.content,
-                "attachments": [media.url for media in tweet.medias],
-                "author": {"id": tweet.author.id, "name": tweet.author.username},
-                "likes": [
-                    {"user_id": l.user.id, "name": l.user.username} for l in tweet.likes
-                ],
-            }
+    body = feed_body(fragments, next_cursor)
+    if feed_cache.enabled:
+        feed_cache.put(user.id, params, body, [t.id for t in tweets], token)
+    return Response(body, media_type="application/json")
+
+
+@router.get("/search")
+async def search_tweets(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user: AuthUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Tweets matching ``q`` (websearch syntax), best match first."""
+    after = decode_cursor(cursor, (float, int))
+    if search.uses_postgres(session):
+        rank = search.search_rank(q)
+        stmt = (
+            page_rows([rank, Tweet.id])
+            .where(search.search_filter(q))
+            .order_by(desc(rank), desc(Tweet.id))
+            .limit(limit + 1)
+        )
+        if after:
+            stmt = stmt.where(tuple_(rank, Tweet.id) < tuple_(*after))
+        result = await session.execute(stmt)
+        tweets, has_more = split_page(result.all(), limit)
+        keys = [(row.rank, row.id) for row in tweets]
+    else:
+        await search.search_index.load(session)
+        matches, has_more = split_page(
+            search.search_index.search(q, limit + 1, after), limit
+        )
+        result = await session.execute(
+            page_rows([Tweet.id]).where(Tweet.id.in_([i for _, i in matches]))
         )
+        found = {row.id: row for row in result}
+        tweets = [found[i] for _, i in matches if i in found]
+        keys = matches
 
-    return {"result": True, "tweets": tweets_data}
+    fragments = await tweet_fragments(session, tweets)
+    next_cursor = encode_cursor(*keys[-1]) if has_more else None
+    return Response(feed_body(fragments, next_cursor), media_type="application/json")
 
 
 @router.delete("/{tweet_id}")
 async def delete_tweet(
     tweet_id: int,
-    user: User = Depends(get_current_user),
+    user: AuthUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_async_session),
 ):
     tweet = await session.get(Tweet, tweet_id)
     if not tweet or tweet.author_id != user.id:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Tweet not found")
 
+    stored = await session.execute(
+        select(Media.content_hash, Media.url).where(Media.tweet_id == tweet.id)
+    )
+    stored = stored.all()
+
+    await timeline.remove_tweet(session, tweet.id)
+    invalidate_tweet_feeds(session, tweet.id)
+    search.unindex_tweet(session, tweet.id)
+    await tags.remove_tweet(session, tweet.id)
     await session.delete(tweet)
     await session.flush()
+    await release_files(session, stored)
     return {"result": True}
 
 
 @router.post("/{tweet_id}/likes")
 async def like_tweet(
     tweet_id: int,
-    user: User = Depends(get_current_user),
+    user: AuthUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_async_session),
 ):
-    tweet = await session.get(Tweet, tweet_id)
-    if not tweet:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Tweet not found")
-
-    exists_result = await session.execute(
-        select(Like).where(Like.tweet_id == tweet_id, Like.user_id == user.id)
+    new_like = select(
+        literal(tweet_id), literal(user.id), literal(datetime.now())
+    ).where(exists().where(Tweet.id == tweet_id))
+    inserted = await session.execute(
+        upsert(session, Like)
+        .from_select(["tweet_id", "user_id", "created_at"], new_like)
+        .on_conflict_do_nothing(index_elements=["tweet_id", "user_id"])
+        .returning(Like.id)
     )
-    if exists_result.scalar_one_or_none():
+    if inserted.first() is None:
+        if not await _tweet_exists(session, tweet_id):
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "Tweet not found")
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Already liked")
 
-    like = Like(tweet_id=tweet_id, user_id=user.id)
-    session.add(like)
-    tweet.likes_count += 1
-    await session.flush()
-
+    counter = await add_likes(session, tweet_id, 1)
+    invalidate_tweet_feeds(session, tweet_id)
+    _publish_likes(session, tweet_id, counter, 1)
     return {"result": True}
 
 
 @router.delete("/{tweet_id}/likes")
 async def unlike_tweet(
     tweet_id: int,
-    user: User = Depends(get_current_user),
+    user: AuthUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_async_session),
 ):
-    tweet = await session.get(Tweet, tweet_id)
-    if not tweet:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "Tweet not found")
-
-    like_result = await session.execute(
-        select(Like).where(Like.tweet_id == tweet_id, Like.user_id == user.id)
+    deleted = await session.execute(
+        delete(Like)
+        .where(Like.tweet_id == tweet_id, Like.user_id == user.id)
+        .returning(Like.id)
     )
-    like_obj = like_result.scalar_one_or_none()
-    if like_obj:
-        await session.delete(like_obj)
-        tweet.likes_count = max(0, tweet.likes_count - 1)
-        await session.flush()
+    removed = len(deleted.all())
+    if removed:
+        counter = await add_likes(session, tweet_id, -removed)
+        invalidate_tweet_feeds(session, tweet_id)
+        _publish_likes(session, tweet_id, counter, -removed)
+    elif not await _tweet_exists(session, tweet_id):
+        raise HTTPException(status.HTTP_404_NOT_FOUND, "Tweet not found")
 
     return {"result": True}
+
+
+def _publish_likes(session: AsyncSession, tweet_id: int, counter, delta: int):
+    if counter is not None:
+        publish_after_commit(
+            session,
+            {
+                "type": "likes",
+                "tweet_id": tweet_id,
+                "author_id": counter.author_id,
+                "likes_count": counter.likes_count,
+                "delta": delta,
+            },
+        )
+
+
+def _publish_tweets(session: AsyncSession, contents, author_id: int) -> None:
+    """``tweet`` events for ``(tweet_id, content)`` pairs; tags feed app.trends."""
+    for tweet_id, content in contents:
+        publish_after_commit(
+            session,
+            {
+                "type": "tweet",
+                "tweet_id": tweet_id,
+                "author_id": author_id,
+                "tags": tags.extract_tags(content),
+            },
+        )
+
+
+async def _tweet_exists(session: AsyncSession, tweet_id: int) -> bool:
+    result = await session.execute(select(Tweet.id).where(Tweet.id == tweet_id))
+    return result.first() is not None
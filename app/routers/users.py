@@ -1,11 +1,23 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, Query, Response, status
 from sqlalchemy.ext.asyncio import AsyncSession
-from sqlalchemy import select
-from sqlalchemy.orm import selectinload
-from typing import List
-from db.engine import get_async_session
-from db.models import User, Follower
-from app.middleware import api_key_auth
+from sqlalchemy import select, desc, delete, exists, literal
+from typing import List, Optional
+from db.engine import get_async_session, after_commit, upsert
+from db.models import User, Follower, Mention
+from app.middleware import AuthUser, api_key_auth, invalidate_api_key
+from app.counters import add_follow
+from app.events import publish_after_commit
+from app.feed import linked_tweets_page
+from app.feed_cache import invalidate_user_feed
+from app import timeline
+from app.responses import FastJSONResponse
+from app.pagination import (
+    DEFAULT_PAGE_SIZE,
+    MAX_PAGE_SIZE,
+    decode_cursor,
+    encode_cursor,
+    split_page,
+)
 from pydantic import BaseModel, ConfigDict
 from datetime import datetime
 import uuid
@@ -22,7 +34,7 @@ class UserResponse(BaseModel):
     model_config = ConfigDict(from_attributes=True)
 
 
-async def get_current_user(user: User = Depends(api_key_auth)):
+async def get_current_user(user: AuthUser = Depends(api_key_auth)):
     return user
 
 
@@ -34,7 +46,7 @@ class UserPublicOut(BaseModel):
 
 
 @router.get("/me", response_model=dict)
-async def get_me(user: User = Depends(get_current_user)):
+async def get_me(user: AuthUser = Depends(get_current_user)):
     return {
         "result": True,
         "user": {
@@ -46,66 +58,116 @@ async def get_me(user: User = Depends(get_current_user)):
     }
 
 
+@router.get("/me/mentions")
+async def get_my_mentions(
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    cursor: Optional[str] = None,
+    user: AuthUser = Depends(get_current_user),
+    session: AsyncSession = Depends(get_async_session),
+):
+    """Tweets that mention the caller, newest first."""
+    body = await linked_tweets_page(
+        session, Mention, Mention.user_id == user.id, limit, cursor
+    )
+    return Response(body, media_type="application/json")
+
+
+async def _follow_page(session, owner_col, other_col, user_id, limit, cursor):
+    """One page of a follow list as (id, name) pairs, newest follow first."""
+    stmt = (
+        select(Follower.id.label("follow_id"), User.id, User.username)
+        .join(User, User.id == other_col)
+        .where(owner_col == user_id)
+        .order_by(desc(Follower.id))
+        .limit(limit + 1)
+    )
+    after = decode_cursor(cursor, (int,))
+    if after:
+        stmt = stmt.where(Follower.id < after[0])
+    result = await session.execute(stmt)
+    rows, has_more = split_page(result.all(), limit)
+    next_cursor = encode_cursor(rows[-1].follow_id) if has_more else None
+    return [{"id": r.id, "name": r.username} for r in rows], next_cursor
+
+
 @router.get("/{user_id}")
 async def get_user_profile(
     user_id: int,
-    current_user: User = Depends(get_current_user),
+    limit: int = Query(DEFAULT_PAGE_SIZE, ge=1, le=MAX_PAGE_SIZE),
+    followers_cursor: Optional[str] = None,
+    following_cursor: Optional[str] = None,
+    current_user: AuthUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_async_session),
 ):
-    stmt = (
-        select(User)
-        .options(selectinload(User.followers), selectinload(User.following))
-        .where(User.id == user_id)
+    result = await session.execute(
+        select(
+            User.id, User.username, User.followers_count, User.following_count
+        ).where(User.id == user_id)
     )
-    result = await session.execute(stmt)
-    target_user = result.scalar_one_or_none()
+    target_user = result.first()
 
     if not target_user:
         raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
 
-    followers = [
-        {"id": f.follower.id, "name": f.follower.username}
-        for f in target_user.followers
-    ]
-    following = [
-        {"id": f.following.id, "name": f.following.username}
-        for f in target_user.following
-    ]
+    followers, next_followers = await _follow_page(
+        session,
+        Follower.following_id,
+        Follower.follower_id,
+        user_id,
+        limit,
+        followers_cursor,
+    )
+    following, next_following = await _follow_page(
+        session,
+        Follower.follower_id,
+        Follower.following_id,
+        user_id,
+        limit,
+        following_cursor,
+    )
 
-    return {
-        "result": True,
-        "user": {
-            "id": target_user.id,
-            "name": target_user.username,
-            "followers": followers,
-            "following": following,
-        },
-    }
+    # built from plain values already, so skip jsonable_encoder
+    return FastJSONResponse(
+        {
+            "result": True,
+            "user": {
+                "id": target_user.id,
+                "name": target_user.username,
+                "followers": followers,
+                "following": following,
+                "followers_count": target_user.followers_count,
+                "following_count": target_user.following_count,
+            },
+            "next_followers_cursor": next_followers,
+            "next_following_cursor": next_following,
+        }
+    )
 
 
 @router.post("/{user_id}/follow", status_code=status.HTTP_200_OK)
 async def follow_user(
     user_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_async_session),
 ):
-    target_user = await session.get(User, user_id)
-    if not target_user:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
-
-    exists = await session.execute(
-        select(Follower).where(
-            Follower.follower_id == current_user.id, Follower.following_id == user_id
-        )
+    new_follow = select(
+        literal(current_user.id), literal(user_id), literal(datetime.now())
+    ).where(exists().where(User.id == user_id))
+    inserted = await session.execute(
+        upsert(session, Follower)
+        .from_select(["follower_id", "following_id", "created_at"], new_follow)
+        .on_conflict_do_nothing(index_elements=["follower_id", "following_id"])
+        .returning(Follower.id)
     )
-    if exists.scalar_one_or_none():
+    if inserted.first() is None:
+        if not await _user_exists(session, user_id):
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
         raise HTTPException(status.HTTP_400_BAD_REQUEST, "Already following")
 
-    follow = Follower(follower_id=current_user.id, following_id=user_id)
-    session.add(follow)
-
-    current_user.following_count += 1
-    target_user.followers_count += 1
+    await add_follow(session, current_user.id, user_id, 1)
+    await timeline.backfill_follow(session, current_user.id, user_id)
+    invalidate_user_feed(session, current_user.id)
+    _publish_follow(session, current_user.id, user_id, True)
 
     await session.commit()
     return {"result": True}
@@ -114,31 +176,50 @@ async def follow_user(
 @router.delete("/{user_id}/follow", status_code=status.HTTP_200_OK)
 async def unfollow_user(
     user_id: int,
-    current_user: User = Depends(get_current_user),
+    current_user: AuthUser = Depends(get_current_user),
     session: AsyncSession = Depends(get_async_session),
 ):
-    target_user = await session.get(User, user_id)
-    if not target_user:
-        raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
-
-    follow_stmt = select(Follower).where(
-        Follower.follower_id == current_user.id, Follower.following_id == user_id
+    deleted = await session.execute(
+        delete(Follower)
+        .where(
+            Follower.follower_id == current_user.id, Follower.following_id == user_id
+        )
+        .returning(Follower.id)
     )
-    result = await session.execute(follow_stmt)
-    follow = result.scalar_one_or_none()
-
-    if not follow:
+    removed = len(deleted.all())
+    if not removed:
+        if not await _user_exists(session, user_id):
+            raise HTTPException(status.HTTP_404_NOT_FOUND, "User not found")
         raise HTTPException(status.HTTP_404_NOT_FOUND, "Not following")
 
-    await session.delete(follow)
-
-    current_user.following_count = max(0, current_user.following_count - 1)
-    target_user.followers_count = max(0, target_user.followers_count - 1)
+    await add_follow(session, current_user.id, user_id, -removed)
+    await timeline.drop_follow(session, current_user.id, user_id)
+    await timeline.schedule_backfill(session, user_id)
+    invalidate_user_feed(session, current_user.id)
+    _publish_follow(session, current_user.id, user_id, False)
 
     await session.commit()
     return {"result": True}
 
 
+def _publish_follow(session, follower_id: int, following_id: int, active: bool):
+    """Re-route the follower's open live connections (app.events)."""
+    publish_after_commit(
+        session,
+        {
+            "type": "follow",
+            "follower_id": follower_id,
+            "following_id": following_id,
+            "active": active,
+        },
+    )
+
+
+async def _user_exists(session: AsyncSession, user_id: int) -> bool:
+    result = await session.execute(select(User.id).where(User.id == user_id))
+    return result.first() is not None
+
+
 @router.post("/", response_model=UserResponse, status_code=status.HTTP_201_CREATED)
 async def create_user(
     username: str, session: AsyncSession = Depends(get_async_session)
@@ -169,7 +250,12 @@ async def create_superuser(
     existing_user = result.scalar_one_or_none()
 
     if existing_user:
+        old_key = existing_user.api_key
         existing_user.api_key = api_key
+        after_commit(session, lambda: invalidate_api_key(old_key))
+        publish_after_commit(
+            session, {"type": "auth_user", "user_id": existing_user.id}
+        )
         await session.commit()
         return {
             "result": True,
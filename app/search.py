@@ -0,0 +1,116 @@
+import re
+from collections import Counter, defaultdict
+from typing import Iterable, List, Optional, Sequence, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.engine import after_commit
+from db.models import SEARCH_CONFIG, Tweet
+
+_WORD = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Lowercased words, roughly what the 'simple' text search config keeps."""
+    return _WORD.findall(text.lower())
+
+
+def uses_postgres(session: AsyncSession) -> bool:
+    return session.bind.dialect.name == "postgresql"
+
+
+def search_rank(q: str):
+    """``ts_rank_cd`` of a websearch-style query; pairs with ``search_filter``."""
+    return func.ts_rank_cd(
+        Tweet.search_vector, func.websearch_to_tsquery(SEARCH_CONFIG, q)
+    ).label("rank")
+
+
+def search_filter(q: str):
+    """GIN-indexed match of ``Tweet.search_vector`` against the query."""
+    return Tweet.search_vector.op("@@")(func.websearch_to_tsquery(SEARCH_CONFIG, q))
+
+
+class InvertedIndex:
+    """In-process ``word -> {tweet_id: count}`` index for databases without
+    full-text search (the SQLite test setup).
+
+    Loaded from the database on the first search and kept current by the
+    tweet handlers afterwards. Every query word must match; the rank is the
+    number of occurrences of the query words in the tweet.
+    """
+
+    def __init__(self):
+        self.loaded = False
+        self._postings: "defaultdict[str, dict]" = defaultdict(dict)
+        self._words: dict = {}
+
+    def __len__(self) -> int:
+        return len(self._words)
+
+    async def load(self, session: AsyncSession) -> None:
+        if self.loaded:
+            return
+        result = await session.stream(select(Tweet.id, Tweet.content))
+        async for tweet_id, content in result:
+            self.add(tweet_id, content)
+        self.loaded = True
+
+    def add(self, tweet_id: int, content: str) -> None:
+        self.remove(tweet_id)
+        words = Counter(tokenize(content))
+        self._words[tweet_id] = words
+        for word, count in words.items():
+            self._postings[word][tweet_id] = count
+
+    def remove(self, tweet_id: int) -> None:
+        for word in self._words.pop(tweet_id, ()):
+            postings = self._postings[word]
+            postings.pop(tweet_id, None)
+            if not postings:
+                del self._postings[word]
+
+    def search(
+        self, q: str, limit: int, after: Optional[Sequence] = None
+    ) -> List[Tuple[int, int]]:
+        """Up to ``limit`` ``(rank, tweet_id)`` pairs, best first, below ``after``."""
+        words = set(tokenize(q))
+        if not words or any(word not in self._postings for word in words):
+            return []
+        postings = sorted((self._postings[word] for word in words), key=len)
+        matches = [
+            (sum(p[tweet_id] for p in postings), tweet_id)
+            for tweet_id in postings[0]
+            if all(tweet_id in p for p in postings[1:])
+        ]
+        if after:
+            matches = [m for m in matches if m < tuple(after)]
+        matches.sort(reverse=True)
+        return matches[:limit]
+
+    def clear(self) -> None:
+        self._postings.clear()
+        self._words.clear()
+        self.loaded = False
+
+
+search_index = InvertedIndex()
+
+
+def index_tweets(session: AsyncSession, tweets: Iterable[Tuple[int, str]]) -> None:
+    """Add new tweets to the fallback index once they are committed."""
+    if uses_postgres(session) or not search_index.loaded:
+        return
+    tweets = list(tweets)
+
+    def add():
+        for tweet_id, content in tweets:
+            search_index.add(tweet_id, content)
+
+    after_commit(session, add)
+
+
+def unindex_tweet(session: AsyncSession, tweet_id: int) -> None:
+    if not uses_postgres(session) and search_index.loaded:
+        after_commit(session, lambda: search_index.remove(tweet_id))
@@ -0,0 +1,401 @@
+import asyncio
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Iterable, List, Optional, Tuple
+
+from fastapi import HTTPException, UploadFile
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.concurrency import run_in_threadpool
+
+import db.engine
+from app.events import bus, publish_after_commit
+from db.engine import after_commit, run_after_commit, settings
+from db.models import Media
+
+logger = logging.getLogger(__name__)
+
+# a file re-uploaded this recently may be about to gain a new Media row
+GC_GRACE_SECONDS = 300
+
+# multipart boundaries and part headers on top of the file itself
+UPLOAD_OVERHEAD_BYTES = 16 * 1024
+
+# partial uploads live here until they are hashed and moved into place
+TMP_DIR = "tmp"
+
+
+@dataclass(frozen=True)
+class StoredFile:
+    path: str
+    size: int
+    sha256: str
+
+    @property
+    def url(self) -> str:
+        return path_to_url(self.path)
+
+
+def path_to_url(path: str) -> str:
+    return "/medias/" + os.path.relpath(path, settings.MEDIA_DIR).replace(os.sep, "/")
+
+
+def content_path(sha256: str, extension: str) -> str:
+    """media/ab/cd/abcd....ext: two shard levels keep directories small."""
+    return os.path.join(
+        settings.MEDIA_DIR, sha256[:2], sha256[2:4], f"{sha256}.{extension}"
+    )
+
+
+def url_to_path(url: str) -> str:
+    return os.path.join(settings.MEDIA_DIR, *url.removeprefix("/medias/").split("/"))
+
+
+def resolve_media_path(filename: str) -> Optional[str]:
+    """Map a request path to a file under MEDIA_DIR, refusing escapes and
+    partial uploads."""
+    root = os.path.abspath(settings.MEDIA_DIR)
+    path = os.path.abspath(os.path.join(root, filename))
+    if os.path.commonpath([root, path]) != root or path == root:
+        return None
+    if os.path.relpath(path, root).split(os.sep)[0] == TMP_DIR:
+        return None
+    return path
+
+
+def upload_extension(filename: Optional[str], content_type: Optional[str]) -> str:
+    """Stored extension: the client's one if whitelisted, else the one of
+    its content type; 415 when neither is an allowed media type."""
+    allowed = settings.MEDIA_EXTENSIONS
+    extension = os.path.splitext(filename or "")[1].lstrip(".").lower()
+    if extension in allowed:
+        return extension
+    guessed = mimetypes.guess_extension(content_type or "") or ""
+    if guessed.lstrip(".") in allowed:
+        return guessed.lstrip(".")
+    raise HTTPException(415, "Unsupported media type")
+
+
+def check_upload_length(content_length: Optional[str]) -> None:
+    """Refuse an upload by its Content-Length before the body is parsed.
+
+    The server never delivers more than the declared length, so this
+    bounds what the multipart parser spools; without the header the size
+    is unknown up front and the request is refused with 411.
+    """
+    if content_length is None:
+        raise HTTPException(411, "Content-Length required")
+    try:
+        length = int(content_length)
+    except ValueError:
+        raise HTTPException(400, "Invalid Content-Length")
+    if length > settings.MEDIA_MAX_BYTES + UPLOAD_OVERHEAD_BYTES:
+        raise HTTPException(413, "File too large")
+
+
+_CONTENT_NAME = re.compile(r"^([0-9a-f]{64}(?:_w\d+)?)\.")
+
+
+def content_etag(path: str) -> Optional[str]:
+    """Strong ETag for content-addressed files and their resized variants:
+    the hash (plus the variant width) is in the name."""
+    match = _CONTENT_NAME.match(os.path.basename(path))
+    return f'"{match.group(1)}"' if match else None
+
+
+def hash_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(settings.MEDIA_CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class HotFileCache:
+    """LRU of small media bodies bounded by total bytes, not entry count.
+
+    Stored media never change in place, so a hit is served without
+    touching the filesystem at all.
+    """
+
+    def __init__(self, max_bytes: int, max_file_bytes: int):
+        self.max_bytes = max_bytes
+        self.max_file_bytes = max_file_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self._files: "OrderedDict[str, tuple]" = OrderedDict()
+
+    def get(self, path: str) -> Optional[tuple]:
+        entry = self._files.get(path)
+        if entry is None:
+            self.misses += 1
+            return None
+        self._files.move_to_end(path)
+        self.hits += 1
+        return entry
+
+    def put(self, path: str, etag: str, body: bytes) -> None:
+        if len(body) > self.max_file_bytes or path in self._files:
+            return
+        self._files[path] = (etag, body)
+        self.size += len(body)
+        while self.size > self.max_bytes:
+            _, (_, evicted) = self._files.popitem(last=False)
+            self.size -= len(evicted)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self._files
+
+    def pop(self, path: str) -> None:
+        entry = self._files.pop(path, None)
+        if entry is not None:
+            self.size -= len(entry[1])
+
+    def stats(self) -> dict:
+        return {
+            "files": len(self._files),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+
+hot_files = HotFileCache(
+    settings.MEDIA_HOT_CACHE_BYTES, settings.MEDIA_HOT_FILE_MAX_BYTES
+)
+
+
+def _write_chunk(out, digest, chunk: bytes) -> None:
+    digest.update(chunk)
+    out.write(chunk)
+
+
+def _place(tmp_path: str, path: str) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # identical bytes may already be stored: replacing them is atomic, gives
+    # the file a fresh mtime for the GC grace and cannot lose a race with
+    # ``_unlink_stale`` the way exists-then-utime could
+    os.replace(tmp_path, path)
+
+
+async def save_upload(upload: UploadFile, extension: str) -> StoredFile:
+    """Stream an upload into content-addressed storage in fixed-size chunks.
+
+    Disk writes and hashing run in the thread pool so the event loop never
+    blocks on file I/O; the upload is never held in memory as a whole.
+    Anything over MEDIA_MAX_BYTES is rejected with 413 as soon as the
+    limit is crossed and the partial file is removed.
+    """
+    directory = os.path.join(settings.MEDIA_DIR, TMP_DIR)
+    os.makedirs(directory, exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix=".part")
+    try:
+        with os.fdopen(fd, "wb") as out:
+            while chunk := await upload.read(settings.MEDIA_CHUNK_SIZE):
+                size += len(chunk)
+                if size > settings.MEDIA_MAX_BYTES:
+                    raise HTTPException(413, "File too large")
+                await run_in_threadpool(_write_chunk, out, digest, chunk)
+        sha256 = digest.hexdigest()
+        path = content_path(sha256, extension)
+        await run_in_threadpool(_place, tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.unlink(tmp_path)
+        raise
+    return StoredFile(path=path, size=size, sha256=sha256)
+
+
+def _forget_hot(event: dict) -> None:
+    for path in event["paths"]:
+        hot_files.pop(os.path.abspath(path))
+        stem, ext = os.path.splitext(path)
+        for width in settings.MEDIA_VARIANT_WIDTHS:
+            hot_files.pop(os.path.abspath(f"{stem}_w{width}{ext}"))
+
+
+# each worker holds its own copies of hot files
+bus.on("media_released", _forget_hot)
+
+
+def _fresh(path: str) -> bool:
+    return time.time() - os.path.getmtime(path) <= GC_GRACE_SECONDS
+
+
+def _unlink_stale(path: str) -> bool:
+    """Remove ``path`` unless it was (re)placed within GC_GRACE_SECONDS.
+
+    The file is first renamed aside and its mtime checked again: a
+    concurrent upload of the same bytes either landed before the rename,
+    and the fresh mtime moves the file back, or lands after it on the
+    now-free name.
+    """
+    try:
+        if _fresh(path):
+            return False
+        aside = f"{path}.gc-{os.getpid()}"
+        os.rename(path, aside)
+    except FileNotFoundError:
+        return False
+    if _fresh(aside):
+        os.replace(aside, path)
+        return False
+    os.unlink(aside)
+    return True
+
+
+def _remove_unreferenced(paths: Iterable[str]) -> None:
+    """Files still in their grace period stay; ``MediaSweeper`` retries them.
+
+    Blocking; run it in the thread pool.
+    """
+    for path in paths:
+        if not _unlink_stale(path):
+            continue
+        stem, ext = os.path.splitext(path)
+        for width in settings.MEDIA_VARIANT_WIDTHS:
+            try:
+                os.unlink(f"{stem}_w{width}{ext}")
+            except FileNotFoundError:
+                pass
+
+
+async def release_files(session: AsyncSession, medias: Iterable[tuple]) -> None:
+    """Schedule removal of stored files no Media row references any more.
+
+    ``medias`` are ``(content_hash, url)`` pairs of rows deleted in this
+    session; the remaining rows sharing a url are the file's reference count.
+    Call after the delete is flushed; files go once the transaction commits.
+    """
+    medias = [(h, url) for h, url in medias if h]
+    if not medias:
+        return
+    result = await session.execute(
+        select(Media.url).where(
+            Media.content_hash.in_({h for h, _ in medias}),
+            Media.url.in_({url for _, url in medias}),
+        )
+    )
+    still_used = set(result.scalars())
+    orphans = [url_to_path(url) for _, url in medias if url not in still_used]
+    if orphans:
+        after_commit(session, lambda: run_in_threadpool(_remove_unreferenced, orphans))
+        publish_after_commit(session, {"type": "media_released", "paths": orphans})
+
+
+_ORIGINAL_NAME = re.compile(r"^[0-9a-f]{64}\.\w+$")
+# files the sweep looks up per query
+SWEEP_BATCH = 500
+
+
+def _scan_media() -> Tuple[List[str], List[str]]:
+    """Stored originals, and leftovers (partial uploads, files renamed
+    aside by a worker that died mid-GC) that nothing can reference."""
+    root = settings.MEDIA_DIR
+    originals, leftovers = [], []
+    tmp = os.path.join(root, TMP_DIR)
+    if os.path.isdir(tmp):
+        leftovers += [entry.path for entry in os.scandir(tmp)]
+    for first in os.listdir(root) if os.path.isdir(root) else ():
+        if first == TMP_DIR or len(first) != 2:
+            continue
+        for second in os.listdir(os.path.join(root, first)):
+            directory = os.path.join(root, first, second)
+            if not os.path.isdir(directory):
+                continue
+            for entry in os.scandir(directory):
+                if ".gc-" in entry.name:
+                    leftovers.append(entry.path)
+                elif _ORIGINAL_NAME.match(entry.name):
+                    originals.append(entry.path)
+    return originals, leftovers
+
+
+def _remove_leftovers(paths: Iterable[str]) -> None:
+    for path in paths:
+        try:
+            if not _fresh(path):
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+
+async def sweep_media(session: AsyncSession) -> int:
+    """Collect what ``release_files`` could not; returns files released.
+
+    Uploads left unattached for MEDIA_UNATTACHED_TTL lose their Media row,
+    and every stored original no row references is removed once its grace
+    period is over, together with its variants. That covers files skipped
+    while in their grace period at release time as well as uploads that
+    never made it into a tweet.
+    """
+    cutoff = datetime.now() - timedelta(seconds=settings.MEDIA_UNATTACHED_TTL)
+    # their files are unreferenced from here on and picked up by the scan
+    await session.execute(
+        delete(Media).where(Media.tweet_id.is_(None), Media.created_at < cutoff)
+    )
+
+    originals, leftovers = await run_in_threadpool(_scan_media)
+    await run_in_threadpool(_remove_leftovers, leftovers)
+    orphans = []
+    for start in range(0, len(originals), SWEEP_BATCH):
+        batch = originals[start : start + SWEEP_BATCH]
+        urls = {path_to_url(path): path for path in batch}
+        result = await session.execute(select(Media.url).where(Media.url.in_(urls)))
+        used = set(result.scalars())
+        orphans += [path for url, path in urls.items() if url not in used]
+    if orphans:
+        after_commit(session, lambda: run_in_threadpool(_remove_unreferenced, orphans))
+        publish_after_commit(session, {"type": "media_released", "paths": orphans})
+    return len(orphans)
+
+
+class MediaSweeper:
+    """Background task running ``sweep_media`` every MEDIA_GC_INTERVAL."""
+
+    def __init__(self):
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.MEDIA_GC_INTERVAL)
+            try:
+                await self.sweep()
+            except Exception:
+                logger.warning("media sweep failed", exc_info=True)
+
+    async def sweep(self) -> int:
+        async with db.engine.AsyncSessionLocal() as session:
+            swept = await sweep_media(session)
+            await session.commit()
+        # file removal and cache invalidation wait for the commit
+        await run_after_commit(session)
+        return swept
+
+    def start(self) -> None:
+        if settings.MEDIA_GC_INTERVAL > 0 and self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+
+media_sweeper = MediaSweeper()
@@ -0,0 +1,60 @@
+import re
+from typing import Iterable, List, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from db.engine import upsert
+from db.models import Mention, TweetHashtag, User
+
+_HASHTAG = re.compile(r"(?<![\w#])#(\w{1,100})")
+_MENTION = re.compile(r"(?<![\w@])@(\w{1,50})")
+
+
+def extract_tags(text: str) -> List[str]:
+    """Distinct lowercased hashtags in order of appearance."""
+    return list(dict.fromkeys(tag.lower() for tag in _HASHTAG.findall(text)))
+
+
+def extract_mentions(text: str) -> List[str]:
+    """Distinct mentioned usernames, as written."""
+    return list(dict.fromkeys(_MENTION.findall(text)))
+
+
+async def record_tweets(session: AsyncSession, tweets: Iterable[Tuple[int, str]]):
+    """Store the hashtags and mentions of ``(tweet_id, content)`` pairs.
+
+    One batched INSERT per table plus one lookup of the mentioned
+    usernames; rows that already exist are skipped, so reprocessing a
+    tweet (see jobs.backfill_tags) is harmless.
+    """
+    tags, mentioned = [], []
+    for tweet_id, content in tweets:
+        tags += [{"tag": tag, "tweet_id": tweet_id} for tag in extract_tags(content)]
+        mentioned += [(name, tweet_id) for name in extract_mentions(content)]
+
+    if tags:
+        await session.execute(
+            upsert(session, TweetHashtag).on_conflict_do_nothing(), tags
+        )
+    if mentioned:
+        result = await session.execute(
+            select(User.username, User.id).where(
+                User.username.in_({name for name, _ in mentioned})
+            )
+        )
+        user_ids = dict(result.all())
+        rows = [
+            {"user_id": user_ids[name], "tweet_id": tweet_id}
+            for name, tweet_id in mentioned
+            if name in user_ids
+        ]
+        if rows:
+            await session.execute(
+                upsert(session, Mention).on_conflict_do_nothing(), rows
+            )
+
+
+async def remove_tweet(session: AsyncSession, tweet_id: int) -> None:
+    await session.execute(delete(TweetHashtag).where(TweetHashtag.tweet_id == tweet_id))
+    await session.execute(delete(Mention).where(Mention.tweet_id == tweet_id))
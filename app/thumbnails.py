@@ -0,0 +1,117 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional
+
+from starlette.concurrency import run_in_threadpool
+
+from db.engine import settings
+
+logger = logging.getLogger(__name__)
+
+
+def variant_path(path: str, width: int) -> str:
+    """media/ab/cd/<hash>.jpg -> media/ab/cd/<hash>_w320.jpg"""
+    stem, ext = os.path.splitext(path)
+    return f"{stem}_w{width}{ext}"
+
+
+def generate_variants(path: str, widths: List[int]) -> List[int]:
+    """Write resized copies of ``path``; runs inside a worker process.
+
+    Idempotent: existing variants are skipped, and each file is written to
+    a temp name of this process first and moved into place, so a crash
+    never leaves a truncated variant behind and workers rendering the same
+    image at once just replace each other's identical result. Images
+    already narrower than a width get a hard link to the original.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return []
+
+    made = []
+    with Image.open(path) as image:
+        image_format = image.format
+        for width in sorted(widths):
+            target = variant_path(path, width)
+            if os.path.exists(target):
+                continue
+            tmp = f"{target}.{os.getpid()}.part"
+            if image.width <= width:
+                try:
+                    os.unlink(tmp)
+                except FileNotFoundError:
+                    pass
+                os.link(path, tmp)
+            else:
+                resized = image.copy()
+                resized.thumbnail((width, image.height))
+                if image_format == "JPEG" and resized.mode not in ("RGB", "L"):
+                    resized = resized.convert("RGB")
+                resized.save(tmp, format=image_format, quality=80, optimize=True)
+                made.append(width)
+            os.replace(tmp, target)
+    return made
+
+
+class ThumbnailWorkers:
+    """Process pool that renders variants off the event loop.
+
+    Jobs live only in memory; a variant lost to a restart is requested again
+    the first time a client asks for it (see ``ensure_variant``).
+    """
+
+    def __init__(self):
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending: set = set()
+
+    def _pool(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=settings.MEDIA_VARIANT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    def schedule(self, path: str) -> None:
+        if not settings.MEDIA_VARIANT_WIDTHS or path in self._pending:
+            return
+        self._pending.add(path)
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(
+            self._pool(), generate_variants, path, settings.MEDIA_VARIANT_WIDTHS
+        )
+        future.add_done_callback(lambda f: self._done(path, f))
+
+    def _done(self, path: str, future) -> None:
+        self._pending.discard(path)
+        if not future.cancelled() and future.exception():
+            logger.warning(
+                "variant generation failed for %s", path, exc_info=future.exception()
+            )
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+workers = ThumbnailWorkers()
+
+
+def _first_existing(*paths: str) -> Optional[str]:
+    return next((path for path in paths if os.path.exists(path)), None)
+
+
+async def ensure_variant(path: str, width: int) -> str:
+    """Path to serve for ``width``: the variant if rendered, else the original."""
+    target = variant_path(path, width)
+    found = await run_in_threadpool(_first_existing, target, path)
+    if found == target:
+        return target
+    if found == path:
+        workers.schedule(path)
+    return path
@@ -0,0 +1,284 @@
+import asyncio
+import logging
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import delete, desc, insert, literal, select, true, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import db.engine
+from db.engine import after_commit, settings, upsert
+from db.models import Follower, TimelineEntry, Tweet, User
+
+logger = logging.getLogger(__name__)
+
+# entries hold ids only; likes_count and score change with every like and
+# are read from the tweet row, so a like never touches followers' timelines
+_ENTRY_COLUMNS = ["user_id", "tweet_id", "author_id"]
+
+
+def _tweet_values():
+    return (Tweet.id, Tweet.author_id)
+
+
+def _entry_key(column):
+    """Sort by the entry's own tweet_id where the feed sorts by tweet id, so
+    the latest feed stays a range scan of the timeline primary key."""
+    if column.key == "id":
+        return TimelineEntry.tweet_id
+    return column
+
+
+async def push_tweet(session: AsyncSession, tweet_id: int, author_id: int) -> None:
+    await push_tweets(session, [tweet_id], author_id)
+
+
+async def push_tweets(session: AsyncSession, tweet_ids: List[int], author_id: int):
+    """Copy new tweets into every follower's timeline in one statement.
+
+    The threshold check runs inside the same statement, so the author's
+    current follower count decides whether the tweets are fanned out.
+    """
+    if not settings.FEED_FANOUT or not tweet_ids:
+        return
+    author_followers = (
+        select(User.followers_count).where(User.id == author_id).scalar_subquery()
+    )
+    followers = (
+        select(Follower.follower_id, *_tweet_values())
+        .join(Tweet, Tweet.author_id == Follower.following_id)
+        .where(
+            Follower.following_id == author_id,
+            Tweet.id.in_(tweet_ids),
+            author_followers < settings.FANOUT_MAX_FOLLOWERS,
+        )
+    )
+    await session.execute(insert(TimelineEntry).from_select(_ENTRY_COLUMNS, followers))
+
+
+async def remove_tweet(session: AsyncSession, tweet_id: int) -> None:
+    if settings.FEED_FANOUT:
+        await session.execute(
+            delete(TimelineEntry).where(TimelineEntry.tweet_id == tweet_id)
+        )
+
+
+async def _copy_recent(session: AsyncSession, followers, author_id: int) -> None:
+    """Insert the author's latest tweets into the timelines of ``followers``
+    (a select of user ids); entries already there are kept."""
+    recent = (
+        select(*_tweet_values())
+        .where(Tweet.author_id == author_id)
+        .order_by(desc(Tweet.id))
+        .limit(settings.FANOUT_BACKFILL_LIMIT)
+        .subquery()
+    )
+    rows = select(followers.c.user_id, *recent.c).join(recent, true())
+    await session.execute(
+        upsert(session, TimelineEntry)
+        .from_select(_ENTRY_COLUMNS, rows)
+        .on_conflict_do_nothing(index_elements=["user_id", "tweet_id"])
+    )
+
+
+async def _followers_count(session: AsyncSession, user_id: int) -> Optional[int]:
+    result = await session.execute(
+        select(User.followers_count).where(User.id == user_id)
+    )
+    return result.scalar()
+
+
+async def backfill_follow(session: AsyncSession, follower_id: int, followee_id: int):
+    """A new follow sees the followee's recent tweets, not only future ones."""
+    if not settings.FEED_FANOUT:
+        return
+    count = await _followers_count(session, followee_id)
+    if count is None or count >= settings.FANOUT_MAX_FOLLOWERS:
+        return
+    follower = select(literal(follower_id).label("user_id")).subquery()
+    await _copy_recent(session, follower, followee_id)
+
+
+async def schedule_backfill(session: AsyncSession, author_id: int) -> None:
+    """Call after an unfollow: an author who just dropped below the fan-out
+    threshold was merged at read time until now, so once the unfollow is
+    committed ``timeline_backfiller`` copies their recent tweets into every
+    follower's timeline.
+
+    Runs once, on the unfollow that lands exactly one below the threshold.
+    """
+    if not settings.FEED_FANOUT:
+        return
+    if await _followers_count(session, author_id) != settings.FANOUT_MAX_FOLLOWERS - 1:
+        return
+    after_commit(session, lambda: timeline_backfiller.schedule(author_id))
+
+
+async def backfill_author(
+    author_id: int, batch: int, pause: float = 0.0, after: int = 0
+) -> int:
+    """Copy the author's recent tweets into their followers' timelines.
+
+    Walks the author's follows by id in short transactions of ``batch``
+    followers each, so no request waits on it and no lock is held for
+    long. Stops early if the author crossed the threshold again meanwhile;
+    an interrupted run is resumed with the last logged follow id as
+    ``after``. Returns how many followers were processed.
+    """
+    done = 0
+    while True:
+        async with db.engine.AsyncSessionLocal() as session:
+            count = await _followers_count(session, author_id)
+            if count is None or count >= settings.FANOUT_MAX_FOLLOWERS:
+                break
+            result = await session.execute(
+                select(Follower.id)
+                .where(Follower.following_id == author_id, Follower.id > after)
+                .order_by(Follower.id)
+                .limit(batch)
+            )
+            follow_ids = result.scalars().all()
+            if not follow_ids:
+                break
+            # re-read in the copying statement: an unfollow since the select
+            # above has already dropped out
+            followers = (
+                select(Follower.follower_id.label("user_id"))
+                .where(
+                    Follower.following_id == author_id,
+                    Follower.id > after,
+                    Follower.id <= follow_ids[-1],
+                )
+                .subquery()
+            )
+            await _copy_recent(session, followers, author_id)
+            await session.commit()
+        after = follow_ids[-1]
+        done += len(follow_ids)
+        logger.info(
+            "author %s backfill: %s followers, last follow id %s",
+            author_id,
+            done,
+            after,
+        )
+        await asyncio.sleep(pause)
+    return done
+
+
+class TimelineBackfiller:
+    """Background task running ``backfill_author`` for scheduled authors,
+    one at a time, FANOUT_BACKFILL_BATCH followers per transaction."""
+
+    def __init__(self):
+        self._task = None
+        # insertion-ordered set of author ids
+        self._pending: Dict[int, None] = {}
+        self._wakeup = None
+
+    def schedule(self, author_id: int) -> None:
+        self._pending[author_id] = None
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def _run(self) -> None:
+        while True:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self._pending:
+                author_id = next(iter(self._pending))
+                del self._pending[author_id]
+                try:
+                    await backfill_author(author_id, settings.FANOUT_BACKFILL_BATCH)
+                except Exception:
+                    logger.warning(
+                        "timeline backfill of author %s failed, "
+                        "resume it with jobs.backfill_timelines",
+                        author_id,
+                        exc_info=True,
+                    )
+
+    def start(self) -> None:
+        if settings.FEED_FANOUT and self._task is None:
+            self._wakeup = asyncio.Event()
+            if self._pending:
+                self._wakeup.set()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        self._wakeup = None
+        if self._pending:
+            logger.warning(
+                "timeline backfill not run for authors %s, "
+                "run jobs.backfill_timelines for them",
+                list(self._pending),
+            )
+
+
+timeline_backfiller = TimelineBackfiller()
+
+
+async def drop_follow(session: AsyncSession, follower_id: int, followee_id: int):
+    if settings.FEED_FANOUT:
+        await session.execute(
+            delete(TimelineEntry).where(
+                TimelineEntry.user_id == follower_id,
+                TimelineEntry.author_id == followee_id,
+            )
+        )
+
+
+async def feed_keys(
+    session: AsyncSession,
+    user_id: int,
+    order: Sequence,
+    limit: int,
+    after: Optional[Sequence] = None,
+) -> List[Tuple]:
+    """Sort keys of up to ``limit`` home-feed tweets below ``after``, best
+    first; the tweet id is the last element of each key.
+
+    Fanned-out tweets come from the user's entries joined to their tweets:
+    the latest feed is a range scan of the entries, popular and ranked sort
+    the user's entries by the tweet's current likes_count or score. Authors
+    above the fan-out threshold were never copied, so their tweets and the
+    user's own come from the per-author tweet indexes and are merged in.
+    """
+    entry_order = [_entry_key(column) for column in order]
+    entries = (
+        select(*entry_order)
+        .join(Tweet, Tweet.id == TimelineEntry.tweet_id)
+        .where(TimelineEntry.user_id == user_id)
+        .order_by(*[desc(column) for column in entry_order])
+        .limit(limit)
+    )
+    celebrities = (
+        select(Follower.following_id)
+        .join(User, User.id == Follower.following_id)
+        .where(
+            Follower.follower_id == user_id,
+            User.followers_count >= settings.FANOUT_MAX_FOLLOWERS,
+        )
+    )
+    merged = (
+        select(*order)
+        .where(Tweet.author_id.in_(celebrities) | (Tweet.author_id == user_id))
+        .order_by(*[desc(column) for column in order])
+        .limit(limit)
+    )
+    if after:
+        entries = entries.where(tuple_(*entry_order) < tuple_(*after))
+        merged = merged.where(tuple_(*order) < tuple_(*after))
+
+    keys = {}
+    # entries copied before the author became a celebrity show up twice
+    for stmt in (entries, merged):
+        for row in await session.execute(stmt):
+            keys[row[-1]] = tuple(row)
+    return sorted(keys.values(), reverse=True)[:limit]
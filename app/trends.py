@@ -0,0 +1,263 @@
+import asyncio
+import heapq
+import json
+import logging
+import struct
+import time
+from array import array
+from datetime import datetime
+from hashlib import blake2b
+from typing import Hashable, List, Optional, Tuple
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+import db.engine
+from app.events import bus
+from db.engine import settings, upsert
+from db.models import TrendCheckpoint
+
+logger = logging.getLogger(__name__)
+
+
+class WindowedSketch:
+    """Count-min sketch over a sliding time window.
+
+    The window is split into ``buckets`` slots, each its own
+    ``depth x width`` table of counters tagged with the absolute bucket
+    number it holds; a slot is zeroed when the window moves past it.
+    Memory is fixed at ``buckets * depth * width`` counters whatever the
+    traffic. Estimates never undercount and overcount by at most
+    ~e/width of the window total with high probability.
+    """
+
+    def __init__(self, window: float, buckets: int, width: int, depth: int):
+        self.span = window / buckets
+        self.width = width
+        self.depth = depth
+        self._slots = [array("I", bytes(4 * width * depth)) for _ in range(buckets)]
+        self._numbers = [-1] * buckets
+
+    def _cells(self, key: Hashable) -> List[int]:
+        digest = blake2b(str(key).encode(), digest_size=4 * self.depth).digest()
+        hashes = struct.unpack(f"<{self.depth}I", digest)
+        return [row * self.width + h % self.width for row, h in enumerate(hashes)]
+
+    def _current(self, now: float) -> int:
+        return int(now // self.span)
+
+    def add(self, key: Hashable, count: int = 1, now: Optional[float] = None) -> None:
+        number = self._current(time.time() if now is None else now)
+        slot = number % len(self._slots)
+        if self._numbers[slot] != number:
+            self._slots[slot] = array("I", bytes(4 * self.width * self.depth))
+            self._numbers[slot] = number
+        counters = self._slots[slot]
+        for cell in self._cells(key):
+            counters[cell] += count
+
+    def estimate(self, key: Hashable, now: Optional[float] = None) -> int:
+        oldest = self._current(time.time() if now is None else now) - len(self._slots)
+        live = [
+            counters
+            for counters, number in zip(self._slots, self._numbers)
+            if number > oldest
+        ]
+        if not live:
+            return 0
+        return min(sum(c[cell] for c in live) for cell in self._cells(key))
+
+    def dump(self) -> bytes:
+        meta = json.dumps(self._numbers).encode()
+        return struct.pack("<I", len(meta)) + meta + b"".join(
+            counters.tobytes() for counters in self._slots
+        )
+
+    def load(self, state: bytes) -> None:
+        """Restore ``dump`` output taken with the same dimensions."""
+        (size,) = struct.unpack_from("<I", state)
+        numbers = json.loads(state[4 : 4 + size])
+        body = state[4 + size :]
+        step = 4 * self.width * self.depth
+        if len(numbers) != len(self._slots) or len(body) != step * len(numbers):
+            raise ValueError("sketch dimensions changed")
+        self._numbers = numbers
+        self._slots = [
+            array("I", body[i * step : (i + 1) * step]) for i in range(len(numbers))
+        ]
+
+
+class TopK:
+    """The ``k`` keys with the highest estimates, kept in a min-heap.
+
+    Scores are refreshed lazily: a key's old heap entries stay behind and
+    are skipped once they no longer match its current score.
+    """
+
+    def __init__(self, k: int):
+        self.k = k
+        self._scores: dict = {}
+        self._heap: List[Tuple[int, Hashable]] = []
+
+    def __len__(self) -> int:
+        return len(self._scores)
+
+    def offer(self, key: Hashable, score: int) -> None:
+        if key not in self._scores and len(self._scores) >= self.k:
+            self._drop_stale()
+            if score <= self._heap[0][0]:
+                return
+            _, evicted = heapq.heappop(self._heap)
+            del self._scores[evicted]
+        self._scores[key] = score
+        heapq.heappush(self._heap, (score, key))
+        if len(self._heap) > 4 * self.k:
+            self.rescore(self._scores.get)
+
+    def _drop_stale(self) -> None:
+        while self._scores.get(self._heap[0][1]) != self._heap[0][0]:
+            heapq.heappop(self._heap)
+
+    def rescore(self, estimate) -> None:
+        self._scores = {key: estimate(key) for key in self._scores}
+        self._heap = [(score, key) for key, score in self._scores.items()]
+        heapq.heapify(self._heap)
+
+    def keys(self) -> List[Hashable]:
+        return list(self._scores)
+
+    def items(self) -> List[Tuple[Hashable, int]]:
+        return list(self._scores.items())
+
+
+class Trend:
+    """Sliding-window heavy hitters of one kind of key (tags, liked tweets)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.sketch = WindowedSketch(
+            settings.TRENDS_WINDOW,
+            settings.TRENDS_BUCKETS,
+            settings.TRENDS_SKETCH_WIDTH,
+            settings.TRENDS_SKETCH_DEPTH,
+        )
+        self.top = TopK(settings.TRENDS_TOP_K)
+
+    def add(self, key: Hashable, now: Optional[float] = None) -> None:
+        self.sketch.add(key, now=now)
+        self.top.offer(key, self.sketch.estimate(key, now))
+
+    def ranked(self, limit: int, now: Optional[float] = None) -> List[Tuple[Hashable, int]]:
+        """Current top keys with their windowed counts, highest first."""
+        self.top.rescore(lambda key: self.sketch.estimate(key, now))
+        ranked = sorted(self.top.items(), key=lambda item: item[1], reverse=True)
+        return [(key, count) for key, count in ranked if count][:limit]
+
+    def clear(self) -> None:
+        self.__init__(self.name)
+
+    def dump(self) -> bytes:
+        keys = json.dumps(self.top.keys()).encode()
+        return struct.pack("<I", len(keys)) + keys + self.sketch.dump()
+
+    def load(self, state: bytes) -> None:
+        (size,) = struct.unpack_from("<I", state)
+        keys = json.loads(state[4 : 4 + size])
+        self.sketch.load(state[4 + size :])
+        for key in keys:
+            self.top.offer(key, self.sketch.estimate(key))
+
+
+trending_tags = Trend("tags")
+trending_tweets = Trend("tweets")
+TRENDS = (trending_tags, trending_tweets)
+
+
+def _on_tweet(event: dict) -> None:
+    for tag in event.get("tags", ()):
+        trending_tags.add(tag)
+
+
+def _on_likes(event: dict) -> None:
+    if event.get("delta", 0) > 0:
+        trending_tweets.add(event["tweet_id"])
+
+
+# the relay delivers every worker's events, so each worker counts all traffic
+bus.on("tweet", _on_tweet)
+bus.on("likes", _on_likes)
+
+
+async def save_checkpoint(session: AsyncSession) -> None:
+    for trend in TRENDS:
+        stmt = upsert(session, TrendCheckpoint).values(
+            name=trend.name, state=trend.dump(), saved_at=datetime.now()
+        )
+        await session.execute(
+            stmt.on_conflict_do_update(
+                index_elements=["name"],
+                set_={"state": stmt.excluded.state, "saved_at": stmt.excluded.saved_at},
+            )
+        )
+
+
+async def load_checkpoint(session: AsyncSession) -> None:
+    result = await session.execute(select(TrendCheckpoint.name, TrendCheckpoint.state))
+    states = dict(result.all())
+    for trend in TRENDS:
+        if trend.name in states:
+            try:
+                trend.load(states[trend.name])
+            except ValueError:
+                logger.warning("ignoring %s trends checkpoint", trend.name)
+
+
+class TrendCheckpointer:
+    """Restores the sketches on startup and saves them every interval.
+
+    Every worker sees the same event stream, so whichever saves last
+    writes practically the same state.
+    """
+
+    def __init__(self):
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(settings.TRENDS_CHECKPOINT_INTERVAL)
+            try:
+                await self.save()
+            except Exception:
+                logger.warning("trends checkpoint failed", exc_info=True)
+
+    async def save(self) -> None:
+        async with db.engine.AsyncSessionLocal() as session:
+            await save_checkpoint(session)
+            await session.commit()
+
+    async def start(self) -> None:
+        if settings.TRENDS_CHECKPOINT_INTERVAL <= 0 or self._task is not None:
+            return
+        try:
+            async with db.engine.AsyncSessionLocal() as session:
+                await load_checkpoint(session)
+        except Exception:
+            logger.warning("trends checkpoint not restored", exc_info=True)
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await self.save()
+        except Exception:
+            logger.warning("final trends checkpoint failed", exc_info=True)
+
+
+trend_checkpointer = TrendCheckpointer()
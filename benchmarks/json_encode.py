@@ -0,0 +1,90 @@
+"""Encode time of feed and profile payloads, stock FastAPI vs app.responses.
+
+No database needed; payloads are synthetic but shaped like the real ones:
+
+    python -m benchmarks.json_encode --tweets 100 --likers 50 --rounds 200
+
+"stock" is what a plain dict return costs (``jsonable_encoder`` followed by
+``JSONResponse.render``), "default" is the same pass with the app's
+default response class, "direct" is a handler returning
+``FastJSONResponse`` itself.
+"""
+
+import argparse
+import time
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+from app.responses import FastJSONResponse, orjson
+
+
+def feed_payload(tweets: int, likers: int) -> dict:
+    return {
+        "result": True,
+        "tweets": [
+            {
+                "id": i,
+                "content": f"tweet №{i} " * 10,
+                "attachments": [f"/static/media/ab/cd/{i:064x}.jpg"],
+                "author": {"id": i % 97, "name": f"user{i % 97}"},
+                "likes": [{"user_id": u, "name": f"fan{u}"} for u in range(likers)],
+                "likes_count": likers,
+            }
+            for i in range(tweets)
+        ],
+        "next_cursor": "eyJ2IjpbMTIzLDQ1Nl19",
+    }
+
+
+def profile_payload(size: int) -> dict:
+    people = [{"id": i, "name": f"user{i}"} for i in range(size)]
+    return {
+        "result": True,
+        "user": {
+            "id": 1,
+            "name": "user1",
+            "followers": people,
+            "following": people,
+            "followers_count": size,
+            "following_count": size,
+        },
+        "next_followers_cursor": None,
+        "next_following_cursor": None,
+    }
+
+
+def timed(encode, payload, rounds: int) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        encode(payload)
+    return (time.perf_counter() - started) / rounds * 1000
+
+
+def main(tweets: int, likers: int, rounds: int) -> None:
+    stock = JSONResponse(None).render
+    fast = FastJSONResponse(None).render
+    encoders = {
+        "stock": lambda p: stock(jsonable_encoder(p)),
+        "default": lambda p: fast(jsonable_encoder(p)),
+        "direct": fast,
+    }
+    print(f"encoder: {'orjson' if orjson else 'json (orjson not installed)'}")
+    payloads = {
+        "feed": feed_payload(tweets, likers),
+        "profile": profile_payload(100),
+    }
+    for name, payload in payloads.items():
+        size = len(fast(payload))
+        results = {label: timed(f, payload, rounds) for label, f in encoders.items()}
+        line = "  ".join(f"{label}={ms:.3f}ms" for label, ms in results.items())
+        print(f"{name:8} {size:>8} bytes  {line}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tweets", type=int, default=100)
+    parser.add_argument("--likers", type=int, default=50)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+    main(args.tweets, args.likers, args.rounds)
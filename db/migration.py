@@ -0,0 +1,88 @@
+"""Helpers shared by the revisions in migrations/versions.
+
+Run them inside ``op.get_context().autocommit_block()``: CREATE INDEX
+CONCURRENTLY refuses to run in a transaction, and batched backfills commit
+each batch on its own.
+"""
+
+from typing import Callable, Optional
+
+from alembic import op
+import sqlalchemy as sa
+
+# a concurrent build that fails (a duplicate for a unique index, a deadlock,
+# a cancelled statement) is dropped and retried this many times
+ATTEMPTS = 3
+
+# ids per UPDATE of a backfill
+BATCH = 10_000
+
+
+def index_is_valid(name: str) -> Optional[bool]:
+    """pg_index.indisvalid of the index, None when it does not exist."""
+    return op.get_bind().scalar(
+        sa.text(
+            """
+            SELECT i.indisvalid FROM pg_index i
+            JOIN pg_class c ON c.oid = i.indexrelid
+            WHERE c.relname = :name
+            """
+        ),
+        {"name": name},
+    )
+
+
+def build_index(
+    name: str,
+    table: str,
+    columns: list,
+    cleanup: Optional[Callable[[], None]] = None,
+    **kw,
+) -> None:
+    """CREATE INDEX CONCURRENTLY that never leaves an INVALID index.
+
+    A failed concurrent build keeps its index, marked invalid, and
+    ``IF NOT EXISTS`` would then skip it on the next run; queries would
+    lose the index and an ON CONFLICT upsert its arbiter. Such leftovers
+    are dropped and rebuilt, after ``cleanup`` when one is given, and the
+    migration fails if the index is still not valid after ATTEMPTS tries.
+    Extra keyword arguments go to ``op.create_index``.
+    """
+    error = None
+    for _ in range(ATTEMPTS):
+        if index_is_valid(name) is False:
+            op.drop_index(name, table_name=table, postgresql_concurrently=True)
+        if index_is_valid(name) is None:
+            try:
+                op.create_index(
+                    name, table, columns, postgresql_concurrently=True, **kw
+                )
+            except sa.exc.DBAPIError as exc:
+                error = exc
+        if index_is_valid(name):
+            return
+        if cleanup is not None:
+            cleanup()
+    raise RuntimeError(
+        f"{name} on {table} could not be built valid after {ATTEMPTS} attempts"
+    ) from error
+
+
+def update_in_batches(table: str, assignments: str, batch: int = BATCH) -> None:
+    """``UPDATE table SET assignments`` walked in ranges of ``batch`` ids.
+
+    Each range commits by itself, so row locks are held for one batch
+    only, live writes go on meanwhile and vacuum can reclaim the old row
+    versions while the backfill runs. The table needs an integer ``id``.
+    """
+    low, high = op.get_bind().execute(
+        sa.text(f"SELECT min(id), max(id) FROM {table}")
+    ).one()
+    if low is None:
+        return
+    for start in range(low, high + 1, batch):
+        op.execute(
+            sa.text(
+                f"UPDATE {table} SET {assignments} WHERE id >= :start AND id < :end"
+            ).bindparams(start=start, end=start + batch)
+        )
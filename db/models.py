@@ -1,6 +1,21 @@
-from sqlalchemy import String, DateTime, ForeignKey, Integer
+from sqlalchemy import (
+    String,
+    DateTime,
+    ForeignKey,
+    Integer,
+    Float,
+    LargeBinary,
+    Index,
+    Computed,
+    Text,
+    column,
+    text,
+)
+from sqlalchemy.dialects.postgresql import TSVECTOR
+from sqlalchemy.ext.compiler import compiles
 from sqlalchemy.orm import Mapped, mapped_column, relationship
 from sqlalchemy.ext.asyncio import AsyncAttrs
+from sqlalchemy.sql.expression import ColumnElement
 from db.engine import Base
 from datetime import datetime
 
@@ -10,7 +25,7 @@ Base.__allow_unmapped__ = True
 class User(Base, AsyncAttrs):
     __tablename__ = "users"
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
     username: Mapped[str] = mapped_column(String(50), unique=True, index=True)
     api_key: Mapped[str] = mapped_column(String(100), unique=True, index=True)
     created_at: Mapped[datetime] = mapped_column(
@@ -29,16 +44,55 @@ class User(Base, AsyncAttrs):
     likes: Mapped[list["Like"]] = relationship(back_populates="user")
 
 
+# text search configuration of Tweet.search_vector; 'simple' does no
+# stemming, so Russian and English tweets are indexed alike
+SEARCH_CONFIG = "simple"
+
+
+class tweet_tsvector(ColumnElement):
+    """Generated-column expression for Tweet.search_vector.
+
+    SQLite (tests) has no tsvector; there the column stays NULL and
+    app.search falls back to an in-process index.
+    """
+
+    inherit_cache = True
+
+    def __init__(self, source):
+        self.source = source
+
+
+@compiles(tweet_tsvector)
+def _tweet_tsvector(element, compiler, **kw):
+    source = compiler.process(element.source, **kw)
+    return f"to_tsvector('{SEARCH_CONFIG}', coalesce({source}, ''))"
+
+
+@compiles(tweet_tsvector, "sqlite")
+def _tweet_tsvector_sqlite(element, compiler, **kw):
+    return "NULL"
+
+
 class Tweet(Base, AsyncAttrs):
     __tablename__ = "tweets"
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
-    author_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    author_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     content: Mapped[str] = mapped_column(String(250))
     likes_count: Mapped[int] = mapped_column(Integer, default=0)
+    # time-decayed popularity for the ranked feed, see app.ranking
+    score: Mapped[float] = mapped_column(Float, default=0.0, server_default="0")
+    # bumped on every change to the rendered tweet (likes), see app.feed
+    version: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=lambda: datetime.now(), nullable=False
     )
+    # full-text search, see app.search; never loaded with the ORM object
+    search_vector = mapped_column(
+        TSVECTOR().with_variant(Text(), "sqlite"),
+        Computed(tweet_tsvector(column("content")), persisted=True),
+        deferred=True,
+    )
 
     author: Mapped["User"] = relationship(back_populates="tweets")
     medias: Mapped[list["Media"]] = relationship(
@@ -48,26 +102,58 @@ class Tweet(Base, AsyncAttrs):
         back_populates="tweet", cascade="all, delete-orphan"
     )
 
+    __table_args__ = (
+        # home feed: author_id IN (...) ORDER BY likes_count, created_at, id
+        Index(
+            "ix_tweets_author_id_feed",
+            "author_id",
+            text("likes_count DESC"),
+            text("created_at DESC"),
+            text("id DESC"),
+        ),
+        Index("ix_tweets_author_id_latest", "author_id", text("id DESC")),
+        Index(
+            "ix_tweets_author_id_ranked", "author_id", text("score DESC"), text("id DESC")
+        ),
+        Index("ix_tweets_search_vector", "search_vector", postgresql_using="gin"),
+    )
+
 
 class Media(Base, AsyncAttrs):
     __tablename__ = "medias"
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
-    tweet_id: Mapped[int] | None = mapped_column(ForeignKey("tweets.id"), index=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    tweet_id: Mapped[int] | None = mapped_column(ForeignKey("tweets.id"))
     url: Mapped[str] = mapped_column(String(250))
+    # sha256 of the stored bytes; uploads with equal hashes share one file
+    content_hash: Mapped[str | None] = mapped_column(String(64), index=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=lambda: datetime.now(), nullable=False
     )
 
     tweet: Mapped["Tweet"] | None = relationship(back_populates="medias")
 
+    __table_args__ = (
+        # attachments of a feed page: index-only scan in upload order
+        Index(
+            "ix_medias_tweet_id_id", "tweet_id", "id", postgresql_include=["url"]
+        ),
+        # get_medias: uploads not attached to any tweet yet
+        Index(
+            "ix_medias_unattached",
+            "id",
+            postgresql_where=text("tweet_id IS NULL"),
+            sqlite_where=text("tweet_id IS NULL"),
+        ),
+    )
+
 
 class Follower(Base, AsyncAttrs):
     __tablename__ = "followers"
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
-    follower_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
-    following_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    follower_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
+    following_id: Mapped[int] = mapped_column(ForeignKey("users.id"))
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=lambda: datetime.now(), nullable=False
     )
@@ -79,12 +165,36 @@ class Follower(Base, AsyncAttrs):
         "User", foreign_keys=[following_id], back_populates="followers"
     )
 
+    __table_args__ = (
+        # also serves every follower_id lookup
+        Index(
+            "uq_followers_follower_id_following_id",
+            "follower_id",
+            "following_id",
+            unique=True,
+        ),
+        # followers list of a profile, newest first
+        Index(
+            "ix_followers_following_id_id",
+            "following_id",
+            "id",
+            postgresql_include=["follower_id"],
+        ),
+        # following list of a profile, newest first
+        Index(
+            "ix_followers_follower_id_id",
+            "follower_id",
+            "id",
+            postgresql_include=["following_id"],
+        ),
+    )
+
 
 class Like(Base, AsyncAttrs):
     __tablename__ = "likes"
 
-    id: Mapped[int] = mapped_column(primary_key=True, index=True)
-    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id"), index=True)
+    id: Mapped[int] = mapped_column(primary_key=True)
+    tweet_id: Mapped[int] = mapped_column(ForeignKey("tweets.id"))
     user_id: Mapped[int] = mapped_column(ForeignKey("users.id"), index=True)
     created_at: Mapped[datetime] = mapped_column(
         DateTime, default=lambda: datetime.now(), nullable=False
@@ -92,3 +202,91 @@ class Like(Base, AsyncAttrs):
 
     tweet: Mapped["Tweet"] = relationship(back_populates="likes")
     user: Mapped["User"] = relationship(back_populates="likes")
+
+    __table_args__ = (
+        # also serves the per-tweet likers lookup
+        Index("uq_likes_tweet_id_user_id", "tweet_id", "user_id", unique=True),
+    )
+
+
+class TimelineEntry(Base, AsyncAttrs):
+    """Materialized home timeline row, written only when FEED_FANOUT is on.
+
+    Holds ids only: likes_count and score are read from the tweet, so a
+    like never rewrites its followers' timelines.
+    """
+
+    __tablename__ = "timeline_entries"
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    tweet_id: Mapped[int] = mapped_column(
+        ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True
+    )
+    author_id: Mapped[int] = mapped_column(Integer)
+
+    __table_args__ = (
+        Index("ix_timeline_entries_tweet_id", "tweet_id"),
+        Index("ix_timeline_entries_user_id_author_id", "user_id", "author_id"),
+    )
+
+
+class LikeCounterShard(Base, AsyncAttrs):
+    """Pending likes_count change of a tweet, written only with LIKES_WRITE_BEHIND.
+
+    Likes land on one of LIKES_COUNTER_SHARDS rows per tweet instead of the
+    tweet row itself; app.counters folds them into Tweet.likes_count.
+    """
+
+    __tablename__ = "like_counter_shards"
+
+    tweet_id: Mapped[int] = mapped_column(
+        ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True
+    )
+    shard: Mapped[int] = mapped_column(Integer, primary_key=True)
+    delta: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+    # likes and unlikes seen, so a +1/-1 pair still changes the tweet's render
+    changes: Mapped[int] = mapped_column(Integer, default=0, server_default="0")
+
+
+class TweetHashtag(Base, AsyncAttrs):
+    """``#tag`` found in a tweet; tags are stored lowercased."""
+
+    __tablename__ = "tweet_hashtags"
+
+    tag: Mapped[str] = mapped_column(String(100), primary_key=True)
+    tweet_id: Mapped[int] = mapped_column(
+        ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True
+    )
+
+    __table_args__ = (
+        # GET /api/tags/{tag}/tweets walks the primary key (tag, tweet_id);
+        # this one serves deletes of a tweet
+        Index("ix_tweet_hashtags_tweet_id", "tweet_id"),
+    )
+
+
+class Mention(Base, AsyncAttrs):
+    """``@username`` of an existing user found in a tweet."""
+
+    __tablename__ = "mentions"
+
+    user_id: Mapped[int] = mapped_column(
+        ForeignKey("users.id", ondelete="CASCADE"), primary_key=True
+    )
+    tweet_id: Mapped[int] = mapped_column(
+        ForeignKey("tweets.id", ondelete="CASCADE"), primary_key=True
+    )
+
+    __table_args__ = (Index("ix_mentions_tweet_id", "tweet_id"),)
+
+
+class TrendCheckpoint(Base):
+    """Serialized trend sketch (app.trends), restored on startup."""
+
+    __tablename__ = "trend_checkpoints"
+
+    name: Mapped[str] = mapped_column(String(50), primary_key=True)
+    state: Mapped[bytes] = mapped_column(LargeBinary)
+    saved_at: Mapped[datetime] = mapped_column(DateTime, nullable=False)
@@ -0,0 +1,34 @@
+"""gunicorn settings for the multi-process mode.
+
+    gunicorn -c gunicorn.conf.py app.main:app
+
+Worker count and preloading come from the app settings (WORKERS,
+PRELOAD_APP), so the startup check in app.main sees the same numbers.
+Send HUP for a graceful restart of the workers; with PRELOAD_APP the code
+is loaded in the master and a new release needs USR2 (new master) + QUIT.
+"""
+
+import os
+
+from db.engine import settings
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = settings.WORKERS
+worker_class = "uvicorn_worker.UvicornWorker"
+preload_app = settings.PRELOAD_APP
+
+# in-flight requests get this long to finish on HUP/TERM
+graceful_timeout = 30
+timeout = 60
+keepalive = 5
+# recycle workers now and then, staggered so they never restart together
+max_requests = 10_000
+max_requests_jitter = 1_000
+
+
+def post_fork(server, worker):
+    # with preload_app the engine was built in the master; a child must not
+    # reuse pooled connections inherited from it
+    from db.engine import engine
+
+    engine.sync_engine.dispose(close=False)
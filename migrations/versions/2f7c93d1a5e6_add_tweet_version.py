@@ -0,0 +1,32 @@
+"""add tweet version
+
+Revision ID: 2f7c93d1a5e6
+Revises: 4b6d2f8e91a3
+Create Date: 2026-10-18 17:32:41.508193
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "2f7c93d1a5e6"
+down_revision: Union[str, Sequence[str], None] = "4b6d2f8e91a3"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # server_default -> без перезаписи таблицы в Postgres 11+
+    op.add_column(
+        "tweets",
+        sa.Column("version", sa.Integer(), server_default="0", nullable=False),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_column("tweets", "version")
@@ -0,0 +1,47 @@
+"""add timeline entries
+
+Revision ID: 3c9e41a7d2b8
+Revises: 5d3d8f99cc05
+Create Date: 2026-10-18 10:12:04.118532
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "3c9e41a7d2b8"
+down_revision: Union[str, Sequence[str], None] = "5d3d8f99cc05"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "timeline_entries",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.Column("author_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id", "tweet_id"),
+    )
+    op.create_index(
+        "ix_timeline_entries_tweet_id", "timeline_entries", ["tweet_id"], unique=False
+    )
+    op.create_index(
+        "ix_timeline_entries_user_id_author_id",
+        "timeline_entries",
+        ["user_id", "author_id"],
+        unique=False,
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_timeline_entries_user_id_author_id", table_name="timeline_entries")
+    op.drop_index("ix_timeline_entries_tweet_id", table_name="timeline_entries")
+    op.drop_table("timeline_entries")
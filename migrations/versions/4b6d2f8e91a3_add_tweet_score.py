@@ -0,0 +1,69 @@
+"""add tweet score
+
+Revision ID: 4b6d2f8e91a3
+Revises: e83f5a9c07d1
+Create Date: 2026-10-18 16:48:09.274415
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from db.migration import build_index, update_in_batches
+
+# revision identifiers, used by Alembic.
+revision: str = "4b6d2f8e91a3"
+down_revision: Union[str, Sequence[str], None] = "e83f5a9c07d1"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# must match app.ranking.RANK_EPOCH and the FEED_RANK_DECAY default
+RANK_EPOCH = "2026-01-01 00:00:00"
+RANK_DECAY = 45000.0
+SCORE = (
+    "ln(greatest(likes_count, 1))"
+    f" + extract(epoch from created_at - timestamp '{RANK_EPOCH}') / {RANK_DECAY}"
+)
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.add_column(
+        "tweets",
+        sa.Column("score", sa.Float(), server_default="0", nullable=False),
+    )
+
+    # пачками по id: один UPDATE на всю таблицу держал бы блокировки
+    # всех строк до конца и раздувал её мёртвыми версиями
+    with op.get_context().autocommit_block():
+        update_in_batches("tweets", f"score = {SCORE}")
+        build_index(
+            "ix_tweets_author_id_latest",
+            "tweets",
+            ["author_id", sa.text("id DESC")],
+        )
+        build_index(
+            "ix_tweets_author_id_ranked",
+            "tweets",
+            ["author_id", sa.text("score DESC"), sa.text("id DESC")],
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_tweets_author_id_ranked",
+            table_name="tweets",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "ix_tweets_author_id_latest",
+            table_name="tweets",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column("tweets", "score")
@@ -0,0 +1,34 @@
+"""add trend checkpoints
+
+Revision ID: 6f0a2c9d83b4
+Revises: d29b7e4a6c15
+Create Date: 2026-10-18 20:14:52.881470
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "6f0a2c9d83b4"
+down_revision: Union[str, Sequence[str], None] = "d29b7e4a6c15"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "trend_checkpoints",
+        sa.Column("name", sa.String(length=50), nullable=False),
+        sa.Column("state", sa.LargeBinary(), nullable=False),
+        sa.Column("saved_at", sa.DateTime(), nullable=False),
+        sa.PrimaryKeyConstraint("name"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table("trend_checkpoints")
@@ -0,0 +1,37 @@
+"""add like counter shards
+
+Revision ID: 8d1e6b47c2fa
+Revises: 2f7c93d1a5e6
+Create Date: 2026-10-18 18:21:07.943126
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "8d1e6b47c2fa"
+down_revision: Union[str, Sequence[str], None] = "2f7c93d1a5e6"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        "like_counter_shards",
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.Column("shard", sa.Integer(), nullable=False),
+        sa.Column("delta", sa.Integer(), server_default="0", nullable=False),
+        sa.Column("changes", sa.Integer(), server_default="0", nullable=False),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("tweet_id", "shard"),
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # несброшенные дельты теряются: перед откатом дождаться flush
+    op.drop_table("like_counter_shards")
@@ -0,0 +1,35 @@
+"""add media content hash
+
+Revision ID: 9a47e0c15f3d
+Revises: 3c9e41a7d2b8
+Create Date: 2026-10-18 12:40:51.307729
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "9a47e0c15f3d"
+down_revision: Union[str, Sequence[str], None] = "3c9e41a7d2b8"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # nullable: files uploaded before content addressing keep their uuid names
+    op.add_column(
+        "medias", sa.Column("content_hash", sa.String(length=64), nullable=True)
+    )
+    op.create_index(
+        op.f("ix_medias_content_hash"), "medias", ["content_hash"], unique=False
+    )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f("ix_medias_content_hash"), table_name="medias")
+    op.drop_column("medias", "content_hash")
@@ -0,0 +1,55 @@
+"""add tweet search vector
+
+Revision ID: a5c3f08e2d71
+Revises: 8d1e6b47c2fa
+Create Date: 2026-10-18 19:02:33.615804
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+from db.migration import build_index
+
+# revision identifiers, used by Alembic.
+revision: str = "a5c3f08e2d71"
+down_revision: Union[str, Sequence[str], None] = "8d1e6b47c2fa"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # STORED generated column: Postgres переписывает таблицу под
+    # ACCESS EXCLUSIVE, запускать в окно обслуживания
+    op.add_column(
+        "tweets",
+        sa.Column(
+            "search_vector",
+            postgresql.TSVECTOR(),
+            sa.Computed("to_tsvector('simple', coalesce(content, ''))", persisted=True),
+        ),
+    )
+
+    with op.get_context().autocommit_block():
+        build_index(
+            "ix_tweets_search_vector",
+            "tweets",
+            ["search_vector"],
+            postgresql_using="gin",
+        )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "ix_tweets_search_vector",
+            table_name="tweets",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+    op.drop_column("tweets", "search_vector")
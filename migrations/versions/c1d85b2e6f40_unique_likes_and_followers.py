@@ -0,0 +1,104 @@
+"""unique likes and followers
+
+Revision ID: c1d85b2e6f40
+Revises: 9a47e0c15f3d
+Create Date: 2026-10-18 14:02:17.551093
+
+Removes duplicate like/follow rows left by the old SELECT-then-INSERT
+handlers, corrects the counters they inflated and builds the unique
+indexes CONCURRENTLY, so writes keep flowing while they are created.
+Each build is checked against pg_index.indisvalid and rebuilt after
+another cleanup when a duplicate slipped in while it ran.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+
+from db.migration import build_index
+
+# revision identifiers, used by Alembic.
+revision: str = "c1d85b2e6f40"
+down_revision: Union[str, Sequence[str], None] = "9a47e0c15f3d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+UNIQUE_INDEXES = [
+    ("uq_likes_tweet_id_user_id", "likes", ["tweet_id", "user_id"]),
+    (
+        "uq_followers_follower_id_following_id",
+        "followers",
+        ["follower_id", "following_id"],
+    ),
+]
+
+
+def _remove_duplicates() -> None:
+    # 1. Удаляем дубликаты, оставляя самую раннюю строку
+    op.execute(
+        """
+        DELETE FROM likes a USING likes b
+        WHERE a.tweet_id = b.tweet_id AND a.user_id = b.user_id AND a.id > b.id
+        """
+    )
+    op.execute(
+        """
+        DELETE FROM followers a USING followers b
+        WHERE a.follower_id = b.follower_id
+          AND a.following_id = b.following_id
+          AND a.id > b.id
+        """
+    )
+
+    # 2. Пересчитываем счётчики, которые дубликаты успели увеличить
+    op.execute(
+        """
+        UPDATE tweets t SET likes_count = c.n
+        FROM (SELECT tweet_id, count(*) AS n FROM likes GROUP BY tweet_id) c
+        WHERE t.id = c.tweet_id AND t.likes_count <> c.n
+        """
+    )
+    op.execute(
+        """
+        UPDATE users u SET followers_count = c.n
+        FROM (SELECT following_id, count(*) AS n FROM followers GROUP BY following_id) c
+        WHERE u.id = c.following_id AND u.followers_count <> c.n
+        """
+    )
+    op.execute(
+        """
+        UPDATE users u SET following_count = c.n
+        FROM (SELECT follower_id, count(*) AS n FROM followers GROUP BY follower_id) c
+        WHERE u.id = c.follower_id AND u.following_count <> c.n
+        """
+    )
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # CREATE INDEX CONCURRENTLY не может идти внутри транзакции;
+    # каждый шаг очистки коммитится сам, до построения индексов
+    with op.get_context().autocommit_block():
+        _remove_duplicates()
+        # дубликат, записанный во время построения, ломает индекс:
+        # build_index удаляет его, чистит таблицы снова и повторяет
+        for name, table, columns in UNIQUE_INDEXES:
+            build_index(name, table, columns, cleanup=_remove_duplicates, unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "uq_followers_follower_id_following_id",
+            table_name="followers",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "uq_likes_tweet_id_user_id",
+            table_name="likes",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
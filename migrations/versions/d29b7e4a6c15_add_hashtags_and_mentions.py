@@ -0,0 +1,48 @@
+"""add hashtags and mentions
+
+Revision ID: d29b7e4a6c15
+Revises: a5c3f08e2d71
+Create Date: 2026-10-18 19:40:18.270356
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = "d29b7e4a6c15"
+down_revision: Union[str, Sequence[str], None] = "a5c3f08e2d71"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    # новые таблицы пустые; старые твиты заполняет python -m jobs.backfill_tags
+    op.create_table(
+        "tweet_hashtags",
+        sa.Column("tag", sa.String(length=100), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("tag", "tweet_id"),
+    )
+    op.create_index("ix_tweet_hashtags_tweet_id", "tweet_hashtags", ["tweet_id"])
+    op.create_table(
+        "mentions",
+        sa.Column("user_id", sa.Integer(), nullable=False),
+        sa.Column("tweet_id", sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(["user_id"], ["users.id"], ondelete="CASCADE"),
+        sa.ForeignKeyConstraint(["tweet_id"], ["tweets.id"], ondelete="CASCADE"),
+        sa.PrimaryKeyConstraint("user_id", "tweet_id"),
+    )
+    op.create_index("ix_mentions_tweet_id", "mentions", ["tweet_id"])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index("ix_mentions_tweet_id", table_name="mentions")
+    op.drop_table("mentions")
+    op.drop_index("ix_tweet_hashtags_tweet_id", table_name="tweet_hashtags")
+    op.drop_table("tweet_hashtags")
@@ -0,0 +1,99 @@
+"""feed query indexes
+
+Revision ID: e83f5a9c07d1
+Revises: c1d85b2e6f40
+Create Date: 2026-10-18 15:31:48.902264
+
+Composite indexes matched to the feed, profile (followers and following
+lists) and unattached-media queries; drops the ix_*_id duplicates of
+primary keys and the single-column indexes the new composites cover.
+Everything runs CONCURRENTLY; new indexes are built, and checked valid,
+before the old ones go.
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from db.migration import build_index
+
+# revision identifiers, used by Alembic.
+revision: str = "e83f5a9c07d1"
+down_revision: Union[str, Sequence[str], None] = "c1d85b2e6f40"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+# (name, table, columns) of indexes replaced by this revision
+REDUNDANT = [
+    ("ix_users_id", "users", ["id"]),
+    ("ix_tweets_id", "tweets", ["id"]),
+    ("ix_medias_id", "medias", ["id"]),
+    ("ix_followers_id", "followers", ["id"]),
+    ("ix_likes_id", "likes", ["id"]),
+    ("ix_tweets_author_id", "tweets", ["author_id"]),
+    ("ix_medias_tweet_id", "medias", ["tweet_id"]),
+    ("ix_followers_follower_id", "followers", ["follower_id"]),
+    ("ix_followers_following_id", "followers", ["following_id"]),
+    ("ix_likes_tweet_id", "likes", ["tweet_id"]),
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    with op.get_context().autocommit_block():
+        build_index(
+            "ix_tweets_author_id_feed",
+            "tweets",
+            [
+                "author_id",
+                sa.text("likes_count DESC"),
+                sa.text("created_at DESC"),
+                sa.text("id DESC"),
+            ],
+        )
+        build_index(
+            "ix_medias_tweet_id_id",
+            "medias",
+            ["tweet_id", "id"],
+            postgresql_include=["url"],
+        )
+        build_index(
+            "ix_medias_unattached",
+            "medias",
+            ["id"],
+            postgresql_where=sa.text("tweet_id IS NULL"),
+        )
+        build_index(
+            "ix_followers_following_id_id",
+            "followers",
+            ["following_id", "id"],
+            postgresql_include=["follower_id"],
+        )
+        build_index(
+            "ix_followers_follower_id_id",
+            "followers",
+            ["follower_id", "id"],
+            postgresql_include=["following_id"],
+        )
+        for name, table, _ in REDUNDANT:
+            op.drop_index(
+                name, table_name=table, postgresql_concurrently=True, if_exists=True
+            )
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    with op.get_context().autocommit_block():
+        for name, table, columns in REDUNDANT:
+            build_index(name, table, columns)
+        for name, table in [
+            ("ix_followers_follower_id_id", "followers"),
+            ("ix_followers_following_id_id", "followers"),
+            ("ix_medias_unattached", "medias"),
+            ("ix_medias_tweet_id_id", "medias"),
+            ("ix_tweets_author_id_feed", "tweets"),
+        ]:
+            op.drop_index(
+                name, table_name=table, postgresql_concurrently=True, if_exists=True
+            )
@@ -0,0 +1,61 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import NullPool
+
+import db.engine
+from db.models import Base
+
+
+@pytest.fixture
+def db_url(tmp_path):
+    """Файловая SQLite вместо Postgres: схема из моделей, без миграций"""
+    path = tmp_path / "test.db"
+    sync_engine = create_engine(f"sqlite:///{path}")
+    Base.metadata.create_all(sync_engine)
+    sync_engine.dispose()
+    return f"sqlite+aiosqlite:///{path}"
+
+
+@pytest.fixture
+def db_client(db_url, monkeypatch):
+    """Клиент приложения поверх тестовой БД"""
+    engine = create_async_engine(db_url, poolclass=NullPool)
+    monkeypatch.setattr(
+        db.engine,
+        "AsyncSessionLocal",
+        sessionmaker(engine, class_=AsyncSession, expire_on_commit=False),
+    )
+    from app.main import app
+    from app.feed import fragment_cache
+    from app.feed_cache import feed_cache
+    from app.graph import follow_graph
+    from app.middleware import auth_cache
+    from app.search import search_index
+    from app.trends import TRENDS
+
+    auth_cache.clear()
+    feed_cache.clear()
+    fragment_cache.clear()
+    follow_graph.clear()
+    search_index.clear()
+    for trend in TRENDS:
+        trend.clear()
+    app.dependency_overrides = {}
+    with TestClient(app) as client:
+        yield client
+
+
+@pytest.fixture
+def make_user(db_client):
+    """Создаёт пользователя через API и возвращает (id, заголовки авторизации)"""
+
+    def _make(username):
+        response = db_client.post("/api/users/", params={"username": username})
+        assert response.status_code == 201
+        body = response.json()
+        return body["id"], {"api-key": body["api_key"]}
+
+    return _make
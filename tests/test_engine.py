@@ -0,0 +1,46 @@
+import asyncio
+from types import SimpleNamespace
+
+from fastapi.testclient import TestClient
+from sqlalchemy.pool import NullPool
+
+from app.main import app
+
+from db.engine import Settings, engine_options, run_after_commit
+
+
+def test_pool_options():
+    options = engine_options(Settings(DB_POOL_SIZE=5, DB_STATEMENT_TIMEOUT=3000))
+    assert options["echo"] is False
+    assert options["pool_size"] == 5
+    assert options["connect_args"]["server_settings"] == {"statement_timeout": "3000"}
+
+
+def test_pgbouncer_mode():
+    options = engine_options(Settings(DB_PGBOUNCER=True, DB_STATEMENT_TIMEOUT=3000))
+    assert options["poolclass"] is NullPool
+    assert "pool_size" not in options
+    assert options["connect_args"] == {"statement_cache_size": 0}
+    assert options["url"].query["prepared_statement_cache_size"] == "0"
+
+
+def test_health_reports_pool():
+    body = TestClient(app).get("/health").json()
+    assert "checked_out" in body["db_pool"]
+
+
+def test_after_commit_callbacks_are_isolated():
+    ran = []
+
+    def boom():
+        raise RuntimeError("broken")
+
+    async def later():
+        ran.append(2)
+
+    session = SimpleNamespace(
+        info={"after_commit": [boom, lambda: ran.append(1), later]}
+    )
+    asyncio.run(run_after_commit(session))
+    assert ran == [1, 2]
+    assert "after_commit" not in session.info
@@ -0,0 +1,442 @@
+from datetime import datetime
+
+import pytest
+from fastapi import HTTPException
+
+from app.pagination import decode_cursor, encode_cursor
+
+
+def test_cursor_roundtrip():
+    created = datetime(2026, 2, 21, 19, 25, 39, 606306)
+    cursor = encode_cursor(5, created, 42)
+    assert decode_cursor(cursor, (int, datetime, int)) == [5, created, 42]
+
+
+def test_cursor_invalid():
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor("not-a-cursor", (int, datetime, int))
+    assert exc.value.status_code == 400
+
+
+@pytest.mark.parametrize(
+    "values", [["x", "y", 1], [True, {"dt": "2026-01-01"}, 1], [1, "2026-01-01", 1]]
+)
+def test_cursor_wrong_types(values):
+    cursor = encode_cursor(*values)
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(cursor, (int, datetime, int))
+    assert exc.value.status_code == 400
+
+
+def test_forged_cursor_is_400(db_client, make_user):
+    _, headers = make_user("reader")
+    cursor = encode_cursor("x", "y", 1)
+    for path, params in [("/api/tweets/", {}), ("/api/tweets/search", {"q": "hi"})]:
+        response = db_client.get(
+            path, params={"cursor": cursor, **params}, headers=headers
+        )
+        assert response.status_code == 400
+
+
+def test_feed_pages_do_not_overlap(db_client, make_user):
+    _, headers = make_user("reader")
+    for i in range(5):
+        db_client.post("/api/tweets/", json={"tweet_data": f"t{i}"}, headers=headers)
+
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2}
+        if cursor:
+            params["cursor"] = cursor
+        body = db_client.get("/api/tweets/", params=params, headers=headers).json()
+        seen += [t["id"] for t in body["tweets"]]
+        cursor = body["next_cursor"]
+        if not cursor:
+            break
+
+    assert len(seen) == 5
+    assert len(set(seen)) == 5
+
+
+def test_fanout_timeline(db_client, make_user, monkeypatch):
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "FEED_FANOUT", True)
+    _, reader = make_user("reader")
+    author_id, author = make_user("author")
+    db_client.post("/api/tweets/", json={"tweet_data": "old"}, headers=author)
+    db_client.post(f"/api/users/{author_id}/follow", headers=reader)
+    new_id = db_client.post(
+        "/api/tweets/", json={"tweet_data": "new"}, headers=author
+    ).json()["tweet_id"]
+
+    feed = db_client.get("/api/tweets/", headers=reader).json()["tweets"]
+    assert {t["content"] for t in feed} == {"old", "new"}
+
+    db_client.delete(f"/api/tweets/{new_id}", headers=author)
+    feed = db_client.get("/api/tweets/", headers=reader).json()["tweets"]
+    assert [t["content"] for t in feed] == ["old"]
+
+    db_client.delete(f"/api/users/{author_id}/follow", headers=reader)
+    assert db_client.get("/api/tweets/", headers=reader).json()["tweets"] == []
+
+
+def test_fanout_sort_keys_and_threshold(db_client, db_url, make_user, monkeypatch):
+    import asyncio
+
+    from sqlalchemy import create_engine, text
+
+    from app.feed_cache import feed_cache
+    from app.timeline import backfill_author, timeline_backfiller
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "FEED_FANOUT", True)
+    monkeypatch.setattr(settings, "FANOUT_MAX_FOLLOWERS", 2)
+    scheduled = []
+    monkeypatch.setattr(timeline_backfiller, "schedule", scheduled.append)
+    author_id, author = make_user("author")
+    _, first = make_user("first")
+    _, second = make_user("second")
+
+    def feed(headers, **params):
+        feed_cache.clear()
+        response = db_client.get("/api/tweets/", params=params, headers=headers)
+        return response.json()
+
+    def entries(user):
+        engine = create_engine(db_url.replace("+aiosqlite", ""))
+        with engine.connect() as connection:
+            rows = connection.execute(
+                text(
+                    "SELECT tweet_id FROM timeline_entries "
+                    "JOIN users ON users.id = user_id WHERE username = :user"
+                ),
+                {"user": user},
+            ).all()
+        engine.dispose()
+        return sorted(row.tweet_id for row in rows)
+
+    old = db_client.post(
+        "/api/tweets/", json={"tweet_data": "old"}, headers=author
+    ).json()["tweet_id"]
+    new = db_client.post(
+        "/api/tweets/", json={"tweet_data": "new"}, headers=author
+    ).json()["tweet_id"]
+    db_client.post(f"/api/users/{author_id}/follow", headers=first)
+    # the second follower makes the author a celebrity: nothing copied
+    db_client.post(f"/api/users/{author_id}/follow", headers=second)
+    assert entries("second") == []
+    assert [t["id"] for t in feed(second, mode="latest")["tweets"]] == [new, old]
+
+    # a like leaves the entries alone; popular reads the tweet's count
+    db_client.post(f"/api/tweets/{old}/likes", headers=first)
+    assert entries("first") == [old, new]
+    page = feed(first, limit=1)
+    assert [t["id"] for t in page["tweets"]] == [old]
+    rest = feed(first, limit=1, cursor=page["next_cursor"])
+    assert [t["id"] for t in rest["tweets"]] == [new]
+
+    # back below the threshold: the remaining follower gets the backfill,
+    # in the background once the unfollow is committed
+    db_client.delete(f"/api/users/{author_id}/follow", headers=first)
+    assert scheduled == [author_id]
+    assert entries("second") == []
+    assert asyncio.run(backfill_author(author_id, batch=1)) == 1
+    assert entries("second") == [old, new]
+    assert [t["id"] for t in feed(second)["tweets"]] == [old, new]
+
+
+def test_feed_likers_cap(db_client, make_user, monkeypatch):
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "FEED_LIKERS_LIMIT", 2)
+    author_id, author = make_user("author")
+    tweet_id = db_client.post(
+        "/api/tweets/", json={"tweet_data": "viral"}, headers=author
+    ).json()["tweet_id"]
+    for i in range(3):
+        _, fan = make_user(f"fan{i}")
+        db_client.post(f"/api/tweets/{tweet_id}/likes", headers=fan)
+
+    tweet = db_client.get("/api/tweets/", headers=author).json()["tweets"][0]
+    assert tweet["likes_count"] == 3
+    assert [l["name"] for l in tweet["likes"]] == ["fan2", "fan1"]
+    assert tweet["author"] == {"id": author_id, "name": "author"}
+
+
+def test_hot_score_decays_with_age():
+    from datetime import timedelta
+
+    from app.ranking import hot_score
+    from db.engine import settings
+
+    now = datetime(2026, 10, 18, 12, 0)
+    day_old = now - timedelta(days=1)
+    assert hot_score(0, now) > hot_score(0, day_old)
+    # an old tweet needs exponentially more likes to keep up
+    assert hot_score(5, day_old) < hot_score(1, now)
+    assert hot_score(1, now - timedelta(seconds=settings.FEED_RANK_DECAY)) == (
+        pytest.approx(hot_score(1, now) - 1)
+    )
+
+
+def test_feed_modes(db_client, make_user):
+    _, author = make_user("author")
+    _, fan = make_user("fan")
+    ids = [
+        db_client.post(
+            "/api/tweets/", json={"tweet_data": f"t{i}"}, headers=author
+        ).json()["tweet_id"]
+        for i in range(3)
+    ]
+    db_client.post(f"/api/tweets/{ids[0]}/likes", headers=fan)
+    db_client.post(f"/api/tweets/{ids[0]}/likes", headers=author)
+
+    def feed(mode, **params):
+        return db_client.get(
+            "/api/tweets/", params={"mode": mode, **params}, headers=author
+        ).json()
+
+    assert [t["id"] for t in feed("latest")["tweets"]] == ids[::-1]
+    assert [t["id"] for t in feed("ranked")["tweets"]][0] == ids[0]
+
+    page = feed("latest", limit=2)
+    rest = feed("latest", limit=2, cursor=page["next_cursor"])
+    assert [t["id"] for t in rest["tweets"]] == [ids[0]]
+
+    response = db_client.get(
+        "/api/tweets/",
+        params={"mode": "ranked", "cursor": page["next_cursor"]},
+        headers=author,
+    )
+    assert response.status_code == 400
+
+
+def test_feed_cache_invalidation(db_client, make_user):
+    from app.feed_cache import feed_cache
+
+    author_id, author = make_user("author")
+    _, fan = make_user("fan")
+    db_client.post(f"/api/users/{author_id}/follow", headers=fan)
+    tweet_id = db_client.post(
+        "/api/tweets/", json={"tweet_data": "hi"}, headers=author
+    ).json()["tweet_id"]
+
+    db_client.get("/api/tweets/", headers=fan)
+    hits = feed_cache.hits
+    assert db_client.get("/api/tweets/", headers=fan).json()["tweets"][0]["id"] == tweet_id
+    assert feed_cache.hits == hits + 1
+
+    db_client.post(f"/api/tweets/{tweet_id}/likes", headers=author)
+    feed = db_client.get("/api/tweets/", headers=fan).json()["tweets"]
+    assert feed[0]["likes_count"] == 1
+
+    second = db_client.post(
+        "/api/tweets/", json={"tweet_data": "again"}, headers=author
+    ).json()["tweet_id"]
+    feed = db_client.get("/api/tweets/", headers=fan).json()["tweets"]
+    assert second in [t["id"] for t in feed]
+
+
+def test_feed_cache_page_expires_on_its_own(monkeypatch):
+    from app import feed_cache as module
+    from app.feed_cache import FeedCache
+
+    now = [1000.0]
+    monkeypatch.setattr(module, "monotonic", lambda: now[0])
+    monkeypatch.setattr(module.settings, "FEED_CACHE_TTL", 30.0)
+    cache = FeedCache(pages_per_user=8)
+    cache.put(1, "old", b"old", [1], cache.token())
+    now[0] += 20
+    # storing another page renews the user's backend entry, not "old"
+    cache.put(1, "new", b"new", [2], cache.token())
+    now[0] += 20
+    assert cache.get(1, "old") is None
+    assert cache.get(1, "new") == b"new"
+
+
+def test_feed_cache_skips_followers_of_big_authors(db_client, make_user, monkeypatch):
+    from app.feed_cache import feed_cache
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "FANOUT_MAX_FOLLOWERS", 2)
+    author_id, author = make_user("author")
+    _, fan = make_user("fan")
+    _, other = make_user("other")
+    db_client.post(f"/api/users/{author_id}/follow", headers=fan)
+    db_client.get("/api/tweets/", headers=fan)
+    db_client.post("/api/tweets/", json={"tweet_data": "small"}, headers=author)
+    assert db_client.get("/api/tweets/", headers=fan).json()["tweets"]
+
+    db_client.post(f"/api/users/{author_id}/follow", headers=other)
+    db_client.get("/api/tweets/", headers=fan)
+    invalidations = feed_cache.invalidations
+    db_client.post("/api/tweets/", json={"tweet_data": "big"}, headers=author)
+    # only the author's own pages; followers' pages wait for FEED_CACHE_TTL
+    assert feed_cache.invalidations == invalidations + 1
+
+
+def test_feed_cache_reverse_index_follows_any_backend():
+    from app.cache import CacheBackend
+    from app.feed_cache import FeedCache
+
+    class OneEntry(CacheBackend):
+        """Keeps only the latest user, like a store under memory pressure."""
+
+        def __init__(self):
+            self.data = {}
+
+        def get(self, key, default=None):
+            return self.data.get(key, default)
+
+        def set(self, key, value):
+            for old in [k for k in self.data if k != key]:
+                self.on_evict(old, self.data.pop(old))
+            self.data[key] = value
+
+        def pop(self, key):
+            return self.data.pop(key, None)
+
+        def clear(self):
+            self.data.clear()
+
+        def stats(self):
+            return {"size": len(self.data)}
+
+    cache = FeedCache(pages_per_user=2, backend=OneEntry())
+    cache.put(1, "page", b"[]", [10, 11], cache.token())
+    cache.put(2, "page", b"[]", [11], cache.token())
+    assert cache.stats()["tracked_tweets"] == 1
+    assert cache._by_tweet[11] == {2}
+
+
+def test_fragment_cache_shared_between_feeds(db_client, make_user):
+    from app.feed import fragment_cache
+    from app.feed_cache import feed_cache
+
+    author_id, author = make_user("author")
+    _, fan = make_user("fan")
+    db_client.post(f"/api/users/{author_id}/follow", headers=fan)
+    tweet_id = db_client.post(
+        "/api/tweets/", json={"tweet_data": "привет"}, headers=author
+    ).json()["tweet_id"]
+
+    db_client.get("/api/tweets/", headers=author)
+    hits = fragment_cache.hits
+    response = db_client.get("/api/tweets/", headers=fan)
+    assert response.headers["content-type"] == "application/json"
+    assert response.json()["tweets"][0]["content"] == "привет"
+    assert fragment_cache.hits == hits + 1
+
+    # a like bumps the version, so the old fragment is never served again
+    db_client.post(f"/api/tweets/{tweet_id}/likes", headers=fan)
+    feed_cache.clear()
+    tweet = db_client.get("/api/tweets/", headers=author).json()["tweets"][0]
+    assert tweet["likes_count"] == 1
+    assert tweet["likes"][0]["name"] == "fan"
+
+
+def test_search_fallback_index(db_client, make_user):
+    _, alice = make_user("alice")
+    ids = {}
+    for text in ["Привет мир", "hello world", "hello hello again"]:
+        ids[text] = db_client.post(
+            "/api/tweets/", json={"tweet_data": text}, headers=alice
+        ).json()["tweet_id"]
+
+    def search(q, **params):
+        response = db_client.get(
+            "/api/tweets/search", params={"q": q, **params}, headers=alice
+        )
+        assert response.status_code == 200
+        return response.json()
+
+    assert [t["id"] for t in search("мир")["tweets"]] == [ids["Привет мир"]]
+    # more occurrences rank first
+    page = search("HELLO", limit=1)
+    assert [t["id"] for t in page["tweets"]] == [ids["hello hello again"]]
+    rest = search("hello", limit=1, cursor=page["next_cursor"])
+    assert [t["id"] for t in rest["tweets"]] == [ids["hello world"]]
+    assert rest["next_cursor"] is None
+    assert search("hello missing")["tweets"] == []
+
+    # the index follows writes made after it was loaded
+    new_id = db_client.post(
+        "/api/tweets/", json={"tweet_data": "new world"}, headers=alice
+    ).json()["tweet_id"]
+    db_client.delete(f"/api/tweets/{ids['hello world']}", headers=alice)
+    assert [t["id"] for t in search("world")["tweets"]] == [new_id]
+
+
+def test_follow_graph_budget_and_edges():
+    from app.graph import FOLLOWERS, FOLLOWING, FollowGraph
+
+    graph = FollowGraph(max_ids=5)
+    graph.put(FOLLOWING, 1, [7, 3], graph.token())
+    graph.put(FOLLOWERS, 2, [4, 5, 6], graph.token())
+    assert list(graph.get(FOLLOWING, 1)) == [3, 7]
+
+    graph.apply(1, 5, True)
+    assert list(graph.get(FOLLOWING, 1)) == [3, 5, 7]
+    # one id over the budget: the least recently used list goes
+    assert graph.get(FOLLOWERS, 2) is None
+    assert graph.size == 3
+
+    token = graph.token()
+    graph.apply(1, 3, False)
+    assert list(graph.get(FOLLOWING, 1)) == [5, 7]
+    # read before the unfollow landed: not cached
+    graph.put(FOLLOWERS, 3, [1], token)
+    assert graph.get(FOLLOWERS, 3) is None
+    graph.put(FOLLOWERS, 9, range(6), graph.token())
+    assert graph.get(FOLLOWERS, 9) is None
+
+
+def test_follow_graph_lists_expire(monkeypatch):
+    from app import graph as module
+    from app.events import bus
+    from app.graph import FOLLOWING, FollowGraph
+
+    now = [1000.0]
+    monkeypatch.setattr(module, "monotonic", lambda: now[0])
+    graph = FollowGraph(max_ids=10, ttl=60)
+    graph.put(FOLLOWING, 1, [2], graph.token())
+    now[0] += 30
+    assert list(graph.get(FOLLOWING, 1)) == [2]
+    # a follow event this worker never saw is corrected by the reload
+    now[0] += 31
+    assert graph.get(FOLLOWING, 1) is None
+    assert graph.size == 0
+
+    # the relay dispatches reset after reconnecting
+    monkeypatch.setattr(module, "follow_graph", graph)
+    graph.put(FOLLOWING, 1, [2], graph.token())
+    bus.dispatch({"type": "reset"})
+    assert graph.get(FOLLOWING, 1) is None
+
+
+def test_feed_reads_follow_graph(db_client, make_user):
+    from app.feed_cache import feed_cache
+    from app.graph import FOLLOWING, follow_graph
+
+    author_id, author = make_user("author")
+    fan_id, fan = make_user("fan")
+    tweet_id = db_client.post(
+        "/api/tweets/", json={"tweet_data": "hi"}, headers=author
+    ).json()["tweet_id"]
+
+    def feed():
+        feed_cache.clear()
+        return [t["id"] for t in db_client.get("/api/tweets/", headers=fan).json()["tweets"]]
+
+    assert feed() == []
+    assert list(follow_graph.get(FOLLOWING, fan_id)) == []
+
+    db_client.post(f"/api/users/{author_id}/follow", headers=fan)
+    assert list(follow_graph.get(FOLLOWING, fan_id)) == [author_id]
+    misses = follow_graph.misses
+    assert feed() == [tweet_id]
+    assert follow_graph.misses == misses
+
+    db_client.delete(f"/api/users/{author_id}/follow", headers=fan)
+    assert feed() == []
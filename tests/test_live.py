@@ -0,0 +1,202 @@
+import asyncio
+
+import pytest
+
+from app.events import RESYNC, EventBus, bus
+
+
+def follow(follower_id, following_id, active=True):
+    return {
+        "type": "follow",
+        "follower_id": follower_id,
+        "following_id": following_id,
+        "active": active,
+    }
+
+
+def test_bus_routes_by_followed_author():
+    events = EventBus(queue_size=10, max_connections=10, max_per_user=1)
+    reader = events.subscribe(1, [2])
+    other = events.subscribe(3, [])
+    assert events.subscribe(1, []) is None
+
+    events.publish({"type": "tweet", "tweet_id": 10, "author_id": 2})
+    assert reader.queue.get_nowait()["tweet_id"] == 10
+    assert other.queue.empty()
+
+    events.publish(follow(3, 2))
+    events.publish(follow(1, 2, active=False))
+    events.publish({"type": "likes", "tweet_id": 10, "author_id": 2, "likes_count": 1})
+    assert reader.queue.empty()
+    assert other.queue.get_nowait()["likes_count"] == 1
+
+    events.unsubscribe(reader)
+    events.unsubscribe(other)
+    assert events.stats()["connections"] == 0
+    assert events.stats()["authors"] == 0
+
+
+def test_slow_subscriber_gets_resync():
+    async def scenario():
+        events = EventBus(queue_size=2, max_connections=10, max_per_user=1)
+        sub = events.subscribe(1, [2])
+        for tweet_id in range(5):
+            events.publish({"type": "tweet", "tweet_id": tweet_id, "author_id": 2})
+        assert sub.queue.qsize() == 1
+        assert await sub.next(0.1) is RESYNC
+        assert await sub.next(0.01) is None
+        events.publish({"type": "tweet", "tweet_id": 9, "author_id": 2})
+        assert (await sub.next(0.1))["tweet_id"] == 9
+        assert events.resyncs == 1
+
+    asyncio.run(scenario())
+
+
+def test_writes_publish_after_commit(db_client, make_user):
+    author_id, author = make_user("author")
+    fan_id, fan = make_user("fan")
+    sub = bus.subscribe(fan_id, [])
+    try:
+        db_client.post(f"/api/users/{author_id}/follow", headers=fan)
+        tweet_id = db_client.post(
+            "/api/tweets/", json={"tweet_data": "hi"}, headers=author
+        ).json()["tweet_id"]
+        db_client.post(f"/api/tweets/{tweet_id}/likes", headers=fan)
+
+        events = [sub.queue.get_nowait() for _ in range(sub.queue.qsize())]
+        assert [e["type"] for e in events] == ["tweet", "likes"]
+        assert events[1]["likes_count"] == 1
+    finally:
+        bus.unsubscribe(sub)
+
+
+def test_live_requires_api_key(db_client):
+    assert db_client.get("/api/live/").status_code == 401
+    assert db_client.get("/api/live/", params={"api_key": "nope"}).status_code == 401
+
+
+def test_invalidation_reaches_other_workers(db_client, make_user):
+    from app.feed_cache import feed_cache
+    from app.middleware import auth_cache
+
+    _, alice = make_user("alice")
+    user_id = db_client.get("/api/users/me", headers=alice).json()["user"]["id"]
+    db_client.get("/api/tweets/", headers=alice)
+    assert feed_cache.backend.get(user_id) is not None
+    assert auth_cache.get(alice["api-key"]) is not None
+
+    # another worker's writes arrive through the relay as plain dispatches
+    bus.dispatch({"type": "feed_users", "user_ids": [user_id]})
+    bus.dispatch({"type": "auth_user", "user_id": user_id})
+    assert feed_cache.backend.get(user_id) is None
+    assert auth_cache.get(alice["api-key"]) is None
+
+
+def test_relay_forwards_published_events():
+    worker_a = EventBus(queue_size=10, max_connections=10, max_per_user=1)
+    worker_b = EventBus(queue_size=10, max_connections=10, max_per_user=1)
+    worker_a.relay = worker_b.dispatch
+    seen = []
+    worker_b.on("feed_users", seen.append)
+    reader = worker_b.subscribe(1, [2])
+
+    worker_a.publish({"type": "feed_users", "user_ids": [1]})
+    worker_a.publish({"type": "tweet", "tweet_id": 5, "author_id": 2})
+    assert seen == [{"type": "feed_users", "user_ids": [1]}]
+    assert reader.queue.get_nowait()["tweet_id"] == 5
+
+    worker_b.dispatch({"type": "reset"})
+    assert reader.queue.get_nowait() is RESYNC
+
+
+def test_several_workers_need_relay(monkeypatch):
+    from app.main import check_workers
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "WORKERS", 4)
+    with pytest.raises(RuntimeError):
+        check_workers(None)
+    check_workers(object())
+    monkeypatch.setattr(settings, "WORKERS", 1)
+    check_workers(None)
+
+
+def test_failing_handler_does_not_fail_committed_write(
+    db_client, make_user, monkeypatch
+):
+    author_id, author = make_user("author")
+
+    def boom(event):
+        raise RuntimeError("broken cache")
+
+    monkeypatch.setitem(bus._handlers, "tweet", [boom])
+    sub = bus.subscribe(author_id, [])
+    try:
+        response = db_client.post(
+            "/api/tweets/", json={"tweet_data": "hi"}, headers=author
+        )
+        assert response.status_code == 201
+        # routing and the later callbacks still ran
+        assert sub.queue.get_nowait()["tweet_id"] == response.json()["tweet_id"]
+        feed = db_client.get("/api/tweets/", headers=author).json()["tweets"]
+        assert [t["content"] for t in feed] == ["hi"]
+    finally:
+        bus.unsubscribe(sub)
+
+
+def test_follow_keeps_author_limit():
+    events = EventBus(queue_size=10, max_connections=10, max_per_user=1, max_authors=2)
+    sub = events.subscribe(1, [2, 3])
+    events.publish(follow(1, 4))
+    # the oldest follow made room; the user's own events still arrive
+    assert list(sub.authors) == [1, 3, 4]
+    for author_id in [1, 2, 3, 4]:
+        events.publish({"type": "tweet", "tweet_id": author_id, "author_id": author_id})
+    assert [sub.queue.get_nowait()["tweet_id"] for _ in range(3)] == [1, 3, 4]
+    assert sub.queue.empty()
+    events.unsubscribe(sub)
+    assert events.stats()["authors"] == 0
+
+
+def test_bridge_splits_payloads_over_notify_limit():
+    from app.events import NOTIFY_MAX_BYTES, PgNotifyBridge
+
+    sender = PgNotifyBridge(EventBus(10, 10, 1), "postgresql://", "feed_events")
+    receiving = EventBus(10, 10, 1)
+    receiver = PgNotifyBridge(receiving, "postgresql://", "feed_events")
+    received, resets = [], []
+    receiving.on("feed_users", lambda event: received.extend(event["user_ids"]))
+    receiving.on("reset", resets.append)
+
+    user_ids = list(range(1_000_000, 1_002_500))
+    sender.send({"type": "feed_users", "user_ids": user_ids})
+    sender.send({"type": "auth_user", "name": "x" * NOTIFY_MAX_BYTES})
+    payloads = []
+    while not sender._outgoing.empty():
+        payloads.append(sender._outgoing.get_nowait())
+    assert len(payloads) > 2
+    assert all(len(p.encode()) < NOTIFY_MAX_BYTES for p in payloads)
+
+    for payload in payloads:
+        receiver._received(None, 0, "feed_events", payload)
+    assert received == user_ids
+    # nothing to split: the others start over instead
+    assert len(resets) == 1
+
+
+def test_bridge_full_backlog_becomes_reset(monkeypatch):
+    from app.events import PgNotifyBridge
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "LIVE_NOTIFY_BACKLOG", 2)
+    bridge = PgNotifyBridge(EventBus(10, 10, 1), "postgresql://", "feed_events")
+    for user_id in range(3):
+        bridge.send({"type": "feed_users", "user_ids": [user_id]})
+    payloads = []
+    while not bridge._outgoing.empty():
+        payloads.append(bridge._outgoing.get_nowait())
+    assert payloads == [bridge._reset_payload]
+
+    # the sender catches up from there
+    bridge.send({"type": "feed_users", "user_ids": [3]})
+    assert bridge._outgoing.qsize() == 1
@@ -2,7 +2,10 @@ import pytest
 from fastapi.testclient import TestClient
 from unittest.mock import patch, MagicMock, AsyncMock
 from app.main import app
+import asyncio
+import hashlib
 import os
+import time
 
 
 @pytest.fixture
@@ -38,3 +41,245 @@ def test_get_media_file_not_found(mock_user):
         client = TestClient(app)
         response = client.get("/medias/nonexistent.jpg")
         assert response.status_code == 404
+
+
+def test_upload_streams_to_disk(db_client, make_user, tmp_path, monkeypatch):
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "MEDIA_DIR", str(tmp_path / "media"))
+    monkeypatch.setattr(settings, "MEDIA_CHUNK_SIZE", 4)
+    _, headers = make_user("uploader")
+    response = db_client.post(
+        "/api/medias/",
+        files={"file": ("cat.jpg", b"0123456789", "image/jpeg")},
+        headers=headers,
+    )
+    assert response.status_code == 201
+    digest = hashlib.sha256(b"0123456789").hexdigest()
+    stored = tmp_path / "media" / digest[:2] / digest[2:4] / f"{digest}.jpg"
+    assert stored.read_bytes() == b"0123456789"
+    assert os.listdir(tmp_path / "media" / "tmp") == []
+
+
+def test_upload_too_large(db_client, make_user, tmp_path, monkeypatch):
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "MEDIA_DIR", str(tmp_path / "media"))
+    monkeypatch.setattr(settings, "MEDIA_MAX_BYTES", 5)
+    _, headers = make_user("uploader")
+    response = db_client.post(
+        "/api/medias/",
+        files={"file": ("cat.jpg", b"0123456789", "image/jpeg")},
+        headers=headers,
+    )
+    assert response.status_code == 413
+    assert os.listdir(tmp_path / "media") == ["tmp"]
+    assert os.listdir(tmp_path / "media" / "tmp") == []
+
+
+def test_upload_refused_by_content_length(db_client, make_user, tmp_path, monkeypatch):
+    from app import storage
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "MEDIA_DIR", str(tmp_path / "media"))
+    monkeypatch.setattr(settings, "MEDIA_MAX_BYTES", 5)
+    _, headers = make_user("uploader")
+    body = b"x" * (storage.UPLOAD_OVERHEAD_BYTES + 10)
+    response = db_client.post(
+        "/api/medias/",
+        files={"file": ("cat.jpg", body, "image/jpeg")},
+        headers=headers,
+    )
+    assert response.status_code == 413
+    # refused before the form was parsed or anything was written
+    assert not (tmp_path / "media").exists()
+
+
+def test_upload_extension_whitelist(db_client, make_user, tmp_path, monkeypatch):
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "MEDIA_DIR", str(tmp_path / "media"))
+    _, headers = make_user("uploader")
+
+    def upload(name, content_type):
+        return db_client.post(
+            "/api/medias/",
+            files={"file": (name, b"png bytes", content_type)},
+            headers=headers,
+        )
+
+    assert upload("cat.PNG", "image/png").status_code == 201
+    # a bogus name falls back to the content type
+    assert upload("evil.php", "image/png").status_code == 201
+    assert upload("x./../../y", "text/html").status_code == 415
+    medias = db_client.get("/api/medias/", headers=headers).json()["medias"]
+    assert {m["url"].rsplit(".", 1)[1] for m in medias} == {"png"}
+
+
+def test_partial_uploads_not_served(db_client, make_user, tmp_path, monkeypatch):
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "MEDIA_DIR", str(tmp_path / "media"))
+    (tmp_path / "media" / "tmp").mkdir(parents=True)
+    (tmp_path / "media" / "tmp" / "abc.part").write_bytes(b"partial")
+    _, headers = make_user("viewer")
+    for path in ["tmp/abc.part", "x/../tmp/abc.part"]:
+        assert db_client.get(f"/api/medias/{path}", headers=headers).status_code == 404
+
+
+def test_duplicate_uploads_share_file(db_client, make_user, tmp_path, monkeypatch):
+    from app import storage
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "MEDIA_DIR", str(tmp_path / "media"))
+    monkeypatch.setattr(storage, "GC_GRACE_SECONDS", -1)
+    _, headers = make_user("uploader")
+    media_ids = [
+        db_client.post(
+            "/api/medias/",
+            files={"file": ("cat.jpg", b"same bytes", "image/jpeg")},
+            headers=headers,
+        ).json()["media_id"]
+        for _ in range(2)
+    ]
+    digest = hashlib.sha256(b"same bytes").hexdigest()
+    stored = tmp_path / "media" / digest[:2] / digest[2:4] / f"{digest}.jpg"
+
+    tweet_ids = [
+        db_client.post(
+            "/api/tweets/",
+            json={"tweet_data": "cat", "tweet_media_ids": [media_id]},
+            headers=headers,
+        ).json()["tweet_id"]
+        for media_id in media_ids
+    ]
+
+    db_client.delete(f"/api/tweets/{tweet_ids[0]}", headers=headers)
+    assert stored.exists()
+    db_client.delete(f"/api/tweets/{tweet_ids[1]}", headers=headers)
+    assert not stored.exists()
+
+
+def test_media_sweep_collects_skipped_and_unattached(
+    db_client, make_user, tmp_path, monkeypatch
+):
+    from app.storage import media_sweeper
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "MEDIA_DIR", str(tmp_path / "media"))
+    _, headers = make_user("uploader")
+
+    def upload(body):
+        media_id = db_client.post(
+            "/api/medias/",
+            files={"file": ("cat.jpg", body, "image/jpeg")},
+            headers=headers,
+        ).json()["media_id"]
+        digest = hashlib.sha256(body).hexdigest()
+        path = tmp_path / "media" / digest[:2] / digest[2:4] / f"{digest}.jpg"
+        return media_id, path
+
+    attached, attached_path = upload(b"attached")
+    kept, kept_path = upload(b"kept")
+    tweet_id = db_client.post(
+        "/api/tweets/",
+        json={"tweet_data": "cat", "tweet_media_ids": [attached]},
+        headers=headers,
+    ).json()["tweet_id"]
+    # deleted within the grace period: release_files leaves the file
+    db_client.delete(f"/api/tweets/{tweet_id}", headers=headers)
+    assert attached_path.exists()
+    part = tmp_path / "media" / "tmp" / "dead.part"
+    part.write_bytes(b"partial")
+
+    old = time.time() - 3600
+    for path in [attached_path, kept_path, part]:
+        os.utime(path, (old, old))
+    assert asyncio.run(media_sweeper.sweep()) == 1
+    assert not attached_path.exists() and not part.exists()
+    # an unattached upload is only dropped after MEDIA_UNATTACHED_TTL
+    assert kept_path.exists()
+
+    monkeypatch.setattr(settings, "MEDIA_UNATTACHED_TTL", -1)
+    assert asyncio.run(media_sweeper.sweep()) == 1
+    assert not kept_path.exists()
+    assert db_client.get("/api/medias/", headers=headers).json()["medias"] == []
+
+
+def test_gc_keeps_file_replaced_during_removal(tmp_path, monkeypatch):
+    from app import storage
+
+    path = tmp_path / "file.jpg"
+    path.write_bytes(b"bytes")
+    # stale when checked, refreshed by an upload before the rename landed
+    checks = iter([False, True])
+    monkeypatch.setattr(storage, "_fresh", lambda p: next(checks))
+    assert storage._unlink_stale(str(path)) is False
+    assert path.read_bytes() == b"bytes"
+    assert os.listdir(tmp_path) == ["file.jpg"]
+
+
+def test_media_caching_headers(db_client, make_user, tmp_path, monkeypatch):
+    from app.storage import hot_files
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "MEDIA_DIR", str(tmp_path / "media"))
+    _, headers = make_user("viewer")
+    db_client.post(
+        "/api/medias/",
+        files={"file": ("cat.jpg", b"0123456789", "image/jpeg")},
+        headers=headers,
+    )
+    url = db_client.get("/api/medias/", headers=headers).json()["medias"][0]["url"]
+    digest = hashlib.sha256(b"0123456789").hexdigest()
+
+    response = db_client.get(f"/api{url}", headers=headers)
+    assert response.content == b"0123456789"
+    assert response.headers["etag"] == f'"{digest}"'
+    assert "immutable" in response.headers["cache-control"]
+
+    hits = hot_files.hits
+    response = db_client.get(
+        f"/api{url}", headers={**headers, "If-None-Match": f'"{digest}"'}
+    )
+    assert response.status_code == 304
+    assert hot_files.hits == hits + 1
+
+    response = db_client.get(f"/api{url}", headers={**headers, "Range": "bytes=2-4"})
+    assert response.status_code == 206
+    assert response.content == b"234"
+    assert response.headers["content-range"] == "bytes 2-4/10"
+
+
+def test_variant_fallback_not_cached_immutable(
+    db_client, make_user, tmp_path, monkeypatch
+):
+    from app.storage import url_to_path
+    from app.thumbnails import variant_path, workers
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "MEDIA_DIR", str(tmp_path / "media"))
+    monkeypatch.setattr(workers, "schedule", lambda path: None)
+    _, headers = make_user("viewer")
+    db_client.post(
+        "/api/medias/",
+        files={"file": ("cat.jpg", b"full size", "image/jpeg")},
+        headers=headers,
+    )
+    url = db_client.get("/api/medias/", headers=headers).json()["medias"][0]["url"]
+
+    response = db_client.get(f"/api{url}", params={"w": 320}, headers=headers)
+    assert response.content == b"full size"
+    assert response.headers["cache-control"] == "no-cache"
+
+    with open(variant_path(url_to_path(url), 320), "wb") as f:
+        f.write(b"small")
+    response = db_client.get(f"/api{url}", params={"w": 320}, headers=headers)
+    assert response.content == b"small"
+    assert "immutable" in response.headers["cache-control"]
+
+
+def test_media_path_escape(db_client, make_user):
+    _, headers = make_user("viewer")
+    response = db_client.get("/api/medias/..%2F..%2Fetc%2Fpasswd", headers=headers)
+    assert response.status_code == 404
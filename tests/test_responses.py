@@ -0,0 +1,38 @@
+import json
+from datetime import datetime
+
+from pydantic import BaseModel
+from sqlalchemy import create_engine, literal, select
+
+from app.responses import FastJSONResponse, dumps
+
+
+class Item(BaseModel):
+    id: int
+    created_at: datetime
+
+
+def test_dumps_models_and_datetimes():
+    when = datetime(2026, 1, 2, 3, 4, 5)
+    body = dumps({"item": Item(id=1, created_at=when), "name": "тест"})
+    assert json.loads(body) == {
+        "item": {"id": 1, "created_at": "2026-01-02T03:04:05"},
+        "name": "тест",
+    }
+    assert "тест".encode() in body
+
+
+def test_dumps_rows():
+    with create_engine("sqlite://").connect() as conn:
+        rows = conn.execute(
+            select(literal(7).label("id"), literal("ann").label("name"))
+        ).all()
+    assert json.loads(FastJSONResponse(rows).body) == [{"id": 7, "name": "ann"}]
+
+
+def test_default_response_class(db_client, make_user):
+    user_id, headers = make_user("alice")
+    response = db_client.get(f"/api/users/{user_id}", headers=headers)
+    assert response.headers["content-type"] == "application/json"
+    assert response.json()["user"]["name"] == "alice"
+    assert db_client.get("/health").json()["status"] == "healthy"
@@ -0,0 +1,58 @@
+import asyncio
+
+import db.engine
+from app.tags import extract_mentions, extract_tags
+from db.models import Tweet
+
+
+def test_extract():
+    text = "#Python and #python, @bob@x #a#b e-mail@host.org #кот"
+    assert extract_tags(text) == ["python", "a", "кот"]
+    assert extract_mentions(text) == ["bob"]
+
+
+def test_tag_and_mention_pages(db_client, make_user):
+    _, alice = make_user("alice")
+    _, bob = make_user("bob")
+    ids = [
+        db_client.post(
+            "/api/tweets/", json={"tweet_data": f"#News {i} for @bob"}, headers=alice
+        ).json()["tweet_id"]
+        for i in range(3)
+    ]
+    db_client.post("/api/tweets/", json={"tweet_data": "#other @nobody"}, headers=alice)
+
+    page = db_client.get("/api/tags/news/tweets", params={"limit": 2}, headers=bob).json()
+    assert [t["id"] for t in page["tweets"]] == [ids[2], ids[1]]
+    rest = db_client.get(
+        "/api/tags/%23NEWS/tweets", params={"cursor": page["next_cursor"]}, headers=bob
+    ).json()
+    assert [t["id"] for t in rest["tweets"]] == [ids[0]]
+
+    mentions = db_client.get("/api/users/me/mentions", headers=bob).json()
+    assert [t["id"] for t in mentions["tweets"]] == ids[::-1]
+    assert db_client.get("/api/users/me/mentions", headers=alice).json()["tweets"] == []
+
+    db_client.delete(f"/api/tweets/{ids[2]}", headers=alice)
+    page = db_client.get("/api/tags/news/tweets", headers=bob).json()
+    assert [t["id"] for t in page["tweets"]] == [ids[1], ids[0]]
+
+
+def test_backfill_existing_tweets(db_client, make_user):
+    from jobs.backfill_tags import backfill
+
+    author_id, alice = make_user("alice")
+
+    async def seed():
+        async with db.engine.AsyncSessionLocal() as session:
+            session.add_all(
+                Tweet(content=f"old #tweet {i}", author_id=author_id) for i in range(5)
+            )
+            await session.commit()
+
+    asyncio.run(seed())
+    assert db_client.get("/api/tags/tweet/tweets", headers=alice).json()["tweets"] == []
+    assert asyncio.run(backfill(batch=2)) == 5
+    assert asyncio.run(backfill(batch=2)) == 5
+    tweets = db_client.get("/api/tags/tweet/tweets", headers=alice).json()["tweets"]
+    assert len(tweets) == 5
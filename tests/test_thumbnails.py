@@ -0,0 +1,58 @@
+import asyncio
+import os
+
+from app import thumbnails
+from app.thumbnails import ensure_variant, variant_path
+
+
+def test_variant_path():
+    assert variant_path("media/ab/cd/abcd.jpg", 320) == "media/ab/cd/abcd_w320.jpg"
+
+
+def test_missing_variant_falls_back(tmp_path, monkeypatch):
+    original = tmp_path / "abcd.jpg"
+    original.write_bytes(b"jpeg")
+    scheduled = []
+    monkeypatch.setattr(thumbnails.workers, "schedule", scheduled.append)
+
+    assert asyncio.run(ensure_variant(str(original), 320)) == str(original)
+    assert scheduled == [str(original)]
+
+    os.link(original, tmp_path / "abcd_w320.jpg")
+    variant = asyncio.run(ensure_variant(str(original), 320))
+    assert variant == str(tmp_path / "abcd_w320.jpg")
+
+
+def test_generate_without_pillow_is_noop(tmp_path, monkeypatch):
+    import builtins
+
+    real_import = builtins.__import__
+
+    def no_pil(name, *args, **kwargs):
+        if name == "PIL":
+            raise ImportError(name)
+        return real_import(name, *args, **kwargs)
+
+    monkeypatch.setattr(builtins, "__import__", no_pil)
+    original = tmp_path / "abcd.jpg"
+    original.write_bytes(b"jpeg")
+    assert thumbnails.generate_variants(str(original), [320]) == []
+
+
+def test_generate_races_another_worker(tmp_path, monkeypatch):
+    from PIL import Image
+
+    original = tmp_path / "abcd.png"
+    Image.new("RGB", (400, 10)).save(original)
+    # another worker finished both variants between the check and the write
+    for width in (320, 640):
+        (tmp_path / f"abcd_w{width}.png").write_bytes(b"done")
+    monkeypatch.setattr(thumbnails.os.path, "exists", lambda path: False)
+
+    assert thumbnails.generate_variants(str(original), [320, 640]) == [320]
+    assert (tmp_path / "abcd_w640.png").read_bytes() == original.read_bytes()
+    assert sorted(p.name for p in tmp_path.iterdir()) == [
+        "abcd.png",
+        "abcd_w320.png",
+        "abcd_w640.png",
+    ]
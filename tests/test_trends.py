@@ -0,0 +1,73 @@
+import asyncio
+
+import db.engine
+from app.trends import TopK, Trend, WindowedSketch, load_checkpoint, save_checkpoint
+
+
+def test_sketch_window_expires():
+    sketch = WindowedSketch(window=60, buckets=6, width=256, depth=4)
+    for _ in range(5):
+        sketch.add("python", now=0)
+    sketch.add("python", now=30)
+    assert sketch.estimate("python", now=30) == 6
+    assert sketch.estimate("rust", now=30) == 0
+    # the first bucket has slid out of the window
+    assert sketch.estimate("python", now=65) == 1
+    assert sketch.estimate("python", now=200) == 0
+
+
+def test_sketch_memory_is_fixed():
+    sketch = WindowedSketch(window=60, buckets=6, width=64, depth=2)
+    for second in range(60):
+        sketch.add("first", now=second)
+    size = len(sketch.dump())
+    for i in range(10_000):
+        sketch.add(f"tag{i}", now=i % 60)
+    assert len(sketch.dump()) == size
+    # count-min never undercounts
+    assert sketch.estimate("tag1", now=59) >= 1
+
+
+def test_topk_keeps_heaviest():
+    top = TopK(2)
+    for key, score in [("a", 1), ("b", 5), ("c", 3), ("a", 2), ("d", 1)]:
+        top.offer(key, score)
+    assert sorted(top.items()) == [("b", 5), ("c", 3)]
+
+
+def test_trend_ranked_and_checkpoint(db_client, make_user):
+    _, alice = make_user("alice")
+    _, bob = make_user("bob")
+    for text in ["#python rocks", "#python again", "#rust", "no tags"]:
+        tweet_id = db_client.post(
+            "/api/tweets/", json={"tweet_data": text}, headers=alice
+        ).json()["tweet_id"]
+    db_client.post(f"/api/tweets/{tweet_id}/likes", headers=alice)
+    db_client.post(f"/api/tweets/{tweet_id}/likes", headers=bob)
+    db_client.delete(f"/api/tweets/{tweet_id}/likes", headers=bob)
+
+    trends = db_client.get("/api/trends/", headers=alice).json()
+    assert trends["tags"] == [{"tag": "python", "count": 2}, {"tag": "rust", "count": 1}]
+    assert trends["tweets"] == [{"tweet_id": tweet_id, "likes": 2}]
+
+    async def roundtrip():
+        async with db.engine.AsyncSessionLocal() as session:
+            await save_checkpoint(session)
+            await session.commit()
+        from app.trends import trending_tags
+
+        trending_tags.clear()
+        assert trending_tags.ranked(5) == []
+        async with db.engine.AsyncSessionLocal() as session:
+            await load_checkpoint(session)
+        return trending_tags.ranked(5)
+
+    assert asyncio.run(roundtrip()) == [("python", 2), ("rust", 1)]
+
+
+def test_trend_limit():
+    trend = Trend("test")
+    for i in range(20):
+        for _ in range(i):
+            trend.add(f"t{i}", now=0)
+    assert [key for key, _ in trend.ranked(3, now=0)] == ["t19", "t18", "t17"]
@@ -45,3 +45,161 @@ def test_tweet_like(mock_session, mock_user):
         client = TestClient(app)
         response = client.post("/tweets/1/likes")
         assert response.status_code in [200, 404]
+
+
+def test_like_counters(db_client, make_user):
+    _, author = make_user("author")
+    _, fan = make_user("fan")
+    tweet_id = db_client.post(
+        "/api/tweets/", json={"tweet_data": "hi"}, headers=author
+    ).json()["tweet_id"]
+
+    assert db_client.post(f"/api/tweets/{tweet_id}/likes", headers=fan).status_code == 200
+    assert db_client.post(f"/api/tweets/{tweet_id}/likes", headers=fan).status_code == 400
+    assert db_client.post("/api/tweets/999/likes", headers=fan).status_code == 404
+    feed = db_client.get("/api/tweets/", headers=author).json()["tweets"]
+    assert feed[0]["likes_count"] == 1
+
+    db_client.delete(f"/api/tweets/{tweet_id}/likes", headers=fan)
+    db_client.delete(f"/api/tweets/{tweet_id}/likes", headers=fan)
+    feed = db_client.get("/api/tweets/", headers=author).json()["tweets"]
+    assert feed[0]["likes_count"] == 0
+    assert db_client.delete("/api/tweets/999/likes", headers=fan).status_code == 404
+
+
+def test_write_behind_likes(db_client, make_user, monkeypatch):
+    import asyncio
+
+    from sqlalchemy import func, select
+
+    import db.engine
+    from app.counters import like_flusher
+    from db.models import LikeCounterShard, Tweet
+
+    monkeypatch.setattr(db.engine.settings, "LIKES_WRITE_BEHIND", True)
+    _, author = make_user("author")
+    fans = [make_user(f"fan{i}")[1] for i in range(3)]
+    tweet_id = db_client.post(
+        "/api/tweets/", json={"tweet_data": "viral"}, headers=author
+    ).json()["tweet_id"]
+
+    def stored():
+        async def query():
+            async with db.engine.AsyncSessionLocal() as session:
+                likes = await session.scalar(
+                    select(Tweet.likes_count).where(Tweet.id == tweet_id)
+                )
+                shards = await session.scalar(
+                    select(func.count()).select_from(LikeCounterShard)
+                )
+                return likes, shards
+
+        return asyncio.run(query())
+
+    db_client.get("/api/tweets/", headers=author)
+    for fan in fans:
+        db_client.post(f"/api/tweets/{tweet_id}/likes", headers=fan)
+    # the feed reads stored count + pending deltas before any flush
+    tweet = db_client.get("/api/tweets/", headers=author).json()["tweets"][0]
+    assert tweet["likes_count"] == 3 and len(tweet["likes"]) == 3
+    assert stored()[0] == 0
+
+    assert asyncio.run(like_flusher.flush()) == 1
+    assert stored() == (3, 0)
+
+    db_client.delete(f"/api/tweets/{tweet_id}/likes", headers=fans[0])
+    tweet = db_client.get("/api/tweets/", headers=author).json()["tweets"][0]
+    assert tweet["likes_count"] == 2
+    asyncio.run(like_flusher.flush())
+    assert stored() == (2, 0)
+
+
+def _upload(db_client, headers, data):
+    response = db_client.post(
+        "/api/medias",
+        files={"file": ("a.png", data, "image/png")},
+        headers=headers,
+    )
+    return response.json()["media_id"]
+
+
+def test_create_tweet_attaches_medias_once(db_client, make_user, tmp_path, monkeypatch):
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "MEDIA_DIR", str(tmp_path / "media"))
+    _, alice = make_user("alice")
+    first = _upload(db_client, alice, b"one")
+    second = _upload(db_client, alice, b"two")
+
+    response = db_client.post(
+        "/api/tweets/",
+        json={"tweet_data": "pics", "tweet_media_ids": [first, second, 999]},
+        headers=alice,
+    )
+    assert response.status_code == 201
+    # already attached medias are not moved to another tweet
+    db_client.post(
+        "/api/tweets/",
+        json={"tweet_data": "steal", "tweet_media_ids": [first]},
+        headers=alice,
+    )
+    feed = db_client.get("/api/tweets/", params={"mode": "latest"}, headers=alice)
+    tweets = {t["content"]: t for t in feed.json()["tweets"]}
+    assert len(tweets["pics"]["attachments"]) == 2
+    assert tweets["steal"]["attachments"] == []
+
+
+def test_create_tweets_batch(db_client, make_user, tmp_path, monkeypatch):
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "FEED_FANOUT", True)
+    monkeypatch.setattr(settings, "MEDIA_DIR", str(tmp_path / "media"))
+    author_id, author = make_user("author")
+    _, fan = make_user("fan")
+    db_client.post(f"/api/users/{author_id}/follow", headers=fan)
+    media = [_upload(db_client, author, bytes([i])) for i in range(3)]
+
+    response = db_client.post(
+        "/api/tweets/batch",
+        json={
+            "tweets": [
+                {"tweet_data": "first", "tweet_media_ids": media[:2]},
+                {"tweet_data": "second", "tweet_media_ids": [media[1], media[2]]},
+                {"tweet_data": "third"},
+            ]
+        },
+        headers=author,
+    )
+    assert response.status_code == 201
+    ids = response.json()["tweet_ids"]
+    assert ids == sorted(ids) and len(ids) == 3
+
+    feed = db_client.get("/api/tweets/", params={"mode": "latest"}, headers=fan)
+    tweets = feed.json()["tweets"]
+    assert [t["content"] for t in tweets] == ["third", "second", "first"]
+    assert [len(t["attachments"]) for t in tweets] == [0, 1, 2]
+
+    empty = db_client.post("/api/tweets/batch", json={"tweets": []}, headers=author)
+    assert empty.status_code == 422
+
+
+def test_final_like_flush_failure_is_logged(monkeypatch, caplog):
+    import asyncio
+
+    from app.counters import LikeFlusher
+    from db.engine import settings
+
+    monkeypatch.setattr(settings, "LIKES_WRITE_BEHIND", True)
+    flusher = LikeFlusher()
+
+    async def broken():
+        raise RuntimeError("database gone")
+
+    monkeypatch.setattr(flusher, "flush", broken)
+
+    async def scenario():
+        flusher.start()
+        await flusher.stop()
+
+    asyncio.run(scenario())
+    assert "final like counter flush failed" in caplog.text
@@ -38,3 +38,71 @@ def test_create_user_exists(mock_session, mock_user):
         client = TestClient(app)
         response = client.post("/users/", json={"username": "exists"})
         assert response.status_code in [409, 404]
+
+
+def test_auth_cache_skips_lookup(db_client, make_user):
+    from app.middleware import auth_cache
+
+    auth_cache.clear()
+    _, headers = make_user("cached")
+    db_client.get("/api/users/me", headers=headers)
+    hits = auth_cache.hits
+    response = db_client.get("/api/users/me", headers=headers)
+    assert response.json()["user"]["name"] == "cached"
+    assert auth_cache.hits == hits + 1
+
+
+def test_superuser_rotation_invalidates_old_key(db_client, make_user):
+    _, headers = make_user("admin")
+    assert db_client.get("/api/users/me", headers=headers).status_code == 200
+
+    db_client.post("/api/users/superuser", params={"username": "admin"})
+
+    assert db_client.get("/api/users/me", headers=headers).status_code == 401
+    response = db_client.get("/api/users/me", headers={"api-key": "test"})
+    assert response.json()["user"]["name"] == "admin"
+
+
+def test_profile_follow_lists_paginate(db_client, make_user):
+    target_id, _ = make_user("star")
+    fans = []
+    for i in range(3):
+        fan_id, headers = make_user(f"fan{i}")
+        db_client.post(f"/api/users/{target_id}/follow", headers=headers)
+        fans.append(fan_id)
+
+    body = db_client.get(
+        f"/api/users/{target_id}", params={"limit": 2}, headers=headers
+    ).json()
+    assert body["user"]["followers_count"] == 3
+    assert [f["id"] for f in body["user"]["followers"]] == fans[::-1][:2]
+
+    rest = db_client.get(
+        f"/api/users/{target_id}",
+        params={"limit": 2, "followers_cursor": body["next_followers_cursor"]},
+        headers=headers,
+    ).json()
+    assert [f["id"] for f in rest["user"]["followers"]] == [fans[0]]
+    assert rest["next_followers_cursor"] is None
+
+    me = db_client.get(f"/api/users/{fans[0]}", headers=headers).json()["user"]
+    assert me["following"] == [{"id": target_id, "name": "star"}]
+
+
+def test_follow_counters(db_client, make_user):
+    star_id, star = make_user("star")
+    fan_id, fan = make_user("fan")
+
+    assert db_client.post(f"/api/users/{star_id}/follow", headers=fan).status_code == 200
+    assert db_client.post(f"/api/users/{star_id}/follow", headers=fan).status_code == 400
+    assert db_client.post("/api/users/999/follow", headers=fan).status_code == 404
+    star_profile = db_client.get(f"/api/users/{star_id}", headers=fan).json()["user"]
+    fan_profile = db_client.get(f"/api/users/{fan_id}", headers=fan).json()["user"]
+    assert star_profile["followers_count"] == 1
+    assert star_profile["following_count"] == 0
+    assert fan_profile["following_count"] == 1
+
+    assert db_client.delete(f"/api/users/{star_id}/follow", headers=fan).status_code == 200
+    assert db_client.delete(f"/api/users/{star_id}/follow", headers=fan).status_code == 404
+    star_profile = db_client.get(f"/api/users/{star_id}", headers=fan).json()["user"]
+    assert star_profile["followers_count"] == 0